@@ -3,7 +3,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tango_with_django_project.setti
 
 import django
 django.setup()
-from rango.models import Category, Page
+from rango.loader import load
+from rango.models import Page
 
 def populate():
     python_pages = [
@@ -71,39 +72,26 @@ def populate():
         }
     }
 
-    # For each category in our dictionary above
+    # Turn our dictionary above into one row per page, each naming its
+    # category, and hand them to the bulk loader, which adds the
+    # categories and pages (or updates them, if they already exist) in a
+    # handful of queries rather than several per row.
+    rows = []
     for category, category_data in categories.items():
-        # Add the category to the database
-        db_category = add_category(category, category_data['views'], category_data['likes'])
         for page in category_data['pages']:
-            # Add each of the category's associated pages to the databasd
-            add_page(db_category, page['title'], page['url'], page['views'])
+            rows.append({
+                'category': category,
+                'category_views': category_data['views'],
+                'category_likes': category_data['likes'],
+                **page,
+            })
+    load(rows)
 
     # Print each category and its associated pages that we've added
-    # to the database
-    for db_category in Category.objects.all():
-        for db_page in Page.objects.filter(category=db_category):
-            print(f'- {db_category}: {db_page}')
-
-def add_page(category, title, url, views=0):
-    # Add page to database, returning a reference to the page model
-    # instance if it already exists. The get_or_create method returns
-    # a tuple with a reference to the model instance, and a boolean
-    # indicating if the model instance had to be created (false if
-    # already existed), so we get the object reference from index 0
-    db_page = Page.objects.get_or_create(category=category, title=title, url=url, views=views)[0]
-    db_page.save()
-    return db_page
-
-def add_category(name, views, likes):
-    # Add category to database, returning a reference to the category
-    # model instance if it already exists. The get_or_create method
-    # returns a tuple with a reference to the model instance, and a
-    # boolean indicating if the model instance had to be created (false
-    # if already existed), so we get the object reference from index 0
-    db_category = Category.objects.get_or_create(name=name, views=views, likes=likes)[0]
-    db_category.save()
-    return db_category
+    # to the database, fetching the pages and their categories together
+    for db_page in Page.objects.select_related('category') \
+            .order_by('category_id', 'id'):
+        print(f'- {db_page.category}: {db_page}')
 
 # Execution starts from here
 if __name__ == '__main__':
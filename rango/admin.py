@@ -1,12 +1,254 @@
-from django.contrib import admin
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.views.main import ChangeList
+from django.db import transaction
+from django.shortcuts import render
+from rango import caching
+from rango.leaderboards import top_pages
 from rango.models import Category, Page, UserProfile
+from rango.pagination import EstimatedCountPaginator
+from rango.search import PAGE, get_index, tokenize
+from rango.urlnorm import HAS_SCHEME, url_hash
 
-class CategoryAdmin(admin.ModelAdmin):
+# Query string parameter of the keyset change list: the primary key of
+# the last row of the previous page
+CURSOR_VAR = 'after'
+
+
+def batches(queryset, batch_size=None):
+    # The primary keys of the queryset's rows, batch_size at a time, each
+    # batch found by seeking past the previous one on the primary key
+    batch_size = batch_size or getattr(settings, 'RANGO_ADMIN_BATCH_SIZE',
+                                       1000)
+    last = None
+    queryset = queryset.order_by('pk').values_list('pk', flat=True)
+    while True:
+        batch = list((queryset if last is None
+                      else queryset.filter(pk__gt=last))[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+
+
+def invalidate_pages(category_ids):
+    # update() bypasses the signals that keep the caches current
+    for slug in Category.objects.filter(pk__in=category_ids) \
+            .values_list('slug', flat=True):
+        caching.invalidate_category(slug)
+    top_pages.invalidate()
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Change list paged by primary key when it is sorted by primary key
+    (the default): the next page is the rows after the last one shown,
+    which the database seeks to with the primary key index, where page
+    numbers would have it skip over every row before with OFFSET. Other
+    orders are paged by number. Either way, the count comes from the
+    model admin's paginator, so it may be an estimate.
+    """
+
+    def get_queryset(self, request):
+        # Not a filter: take it out before the filters are applied
+        self.cursor = self.params.pop(CURSOR_VAR, None)
+        return super().get_queryset(request)
+
+    def get_results(self, request):
+        ordering = self.queryset.query.order_by
+        if tuple(ordering) not in (('pk',), ('-pk',)):
+            self.keyset = False
+            return super().get_results(request)
+
+        self.keyset = True
+        self.paginator = self.model_admin.get_paginator(
+            request, self.queryset, self.list_per_page)
+        self.result_count = self.paginator.count
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+
+        queryset = self.queryset
+        if self.cursor:
+            try:
+                last = int(self.cursor)
+            except ValueError:
+                last = None
+            if last is not None:
+                queryset = queryset.filter(
+                    **{'pk__lt' if ordering[0] == '-pk' else 'pk__gt': last})
+        # One extra row tells whether there is a next page
+        rows = list(queryset[:self.list_per_page + 1])
+        self.next_cursor = None
+        if len(rows) > self.list_per_page:
+            rows = rows[:self.list_per_page]
+            self.next_cursor = rows[-1].pk
+        self.result_list = rows
+        self.multi_page = bool(self.cursor or self.next_cursor)
+
+    # Links for the pagination template (admin/rango/pagination.html)
+    def first_url(self):
+        return self.get_query_string(remove=[CURSOR_VAR])
+
+    def next_url(self):
+        return self.get_query_string({CURSOR_VAR: self.next_cursor})
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    # Change lists that stay fast on big tables: no COUNT(*) of the whole
+    # table, and pages found by primary key rather than OFFSET
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+class CategoryAdmin(ScalableAdmin):
     prepopulated_fields = {'slug': ('name',)}
-class PageAdmin(admin.ModelAdmin):
-    list_display = ('title', 'category', 'url')
+    list_display = ('name', 'slug', 'views', 'likes')
+    # Also what the page form's category autocomplete searches
+    search_fields = ('name',)
+    # Only the indexed columns (ranking by them is what the index does)
+    sortable_by = ('likes',)
+
+
+class TopCategoryFilter(admin.SimpleListFilter):
+    # Filtering by every category would list all of them; offer the most
+    # liked ones (found with the likes index), plus any chosen by URL.
+    title = 'category'
+    parameter_name = 'category'
+
+    def lookups(self, request, model_admin):
+        categories = list(Category.objects.order_by('-likes', 'id')
+                          .values_list('id', 'name')[:20])
+        chosen = self.value()
+        if chosen and chosen.isdigit() and \
+                int(chosen) not in {id for id, _ in categories}:
+            categories += Category.objects.filter(pk=chosen) \
+                .values_list('id', 'name')
+        return [(str(id), name) for id, name in categories]
+
+    def queryset(self, request, queryset):
+        if self.value() and self.value().isdigit():
+            # Uses the (category, views) index
+            return queryset.filter(category_id=self.value())
+        return queryset
+
+
+class MoveToCategoryForm(forms.Form):
+    category = forms.SlugField(help_text='Slug of the category to move to.')
+
+    def clean_category(self):
+        try:
+            return Category.objects.get(slug=self.cleaned_data['category'])
+        except Category.DoesNotExist:
+            raise forms.ValidationError('There is no such category.')
+
+
+class PageAdmin(ScalableAdmin):
+    list_display = ('title', 'category', 'url', 'views')
+    # One query for the page of rows and their categories, rather than
+    # one more per row for category.__str__
+    list_select_related = ('category',)
+    list_filter = (TopCategoryFilter,)
+    # Searched with the search index (see get_search_results)
+    search_fields = ('title', 'url')
+    sortable_by = ('views',)
+    # A search box rather than a <select> of every category
+    autocomplete_fields = ('category',)
+    actions = ['reset_views', 'move_to_category']
+
+    def get_search_results(self, request, queryset, search_term):
+        # The default searches every row for the term with LIKE. An
+        # address is looked up by its key, words in the search index.
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if HAS_SCHEME.match(search_term) or \
+                ('/' in search_term and ' ' not in search_term):
+            return queryset.filter(url_hash=url_hash(search_term)), False
+        limit = getattr(settings, 'RANGO_ADMIN_SEARCH_LIMIT', 1000)
+        matches = get_index().query(tokenize(search_term), limit)
+        return queryset.filter(
+            pk__in=[pk for kind, pk, _ in matches if kind == PAGE]), False
+
+    def reset_views(self, request, queryset):
+        # Batched UPDATEs by primary key, each its own short transaction,
+        # rather than one UPDATE holding locks on every selected row
+        categories = set()
+        reset = 0
+        for pks in batches(queryset):
+            pages = Page.objects.filter(pk__in=pks)
+            with transaction.atomic():
+                categories.update(pages.values_list('category_id', flat=True)
+                                  .distinct())
+                reset += pages.update(views=0)
+        invalidate_pages(categories)
+        self.message_user(request, f'Reset the views of {reset} pages.')
+    reset_views.short_description = 'Reset the views of the selected pages'
+
+    def move_to_category(self, request, queryset):
+        form = MoveToCategoryForm(request.POST if 'apply' in request.POST
+                                  else None)
+        if not form.is_valid():
+            # Ask for the category, passing the selection on
+            return render(request, 'admin/rango/page/move_to_category.html', {
+                **self.admin_site.each_context(request),
+                'opts': self.model._meta,
+                'title': 'Move pages to another category',
+                'form': form,
+                'selected': request.POST.getlist(
+                    helpers.ACTION_CHECKBOX_NAME),
+                'select_across': request.POST.get('select_across', '0'),
+                'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+            })
+
+        category = form.cleaned_data['category']
+        categories = {category.id}
+        moved = skipped = 0
+        for pks in batches(queryset):
+            with transaction.atomic():
+                pages = list(Page.objects.filter(pk__in=pks)
+                             .exclude(category=category)
+                             .values_list('id', 'category_id', 'url_hash'))
+                # A URL can only be in a category once
+                taken = set(Page.objects.filter(
+                    category=category,
+                    url_hash__in={key for _, _, key in pages if key})
+                    .values_list('url_hash', flat=True))
+                movable = []
+                for id, category_id, key in pages:
+                    if key in taken:
+                        skipped += 1
+                        continue
+                    if key:
+                        taken.add(key)
+                    movable.append(id)
+                    categories.add(category_id)
+                moved += Page.objects.filter(pk__in=movable) \
+                    .update(category=category)
+        invalidate_pages(categories)
+        self.message_user(request, f'Moved {moved} pages to {category}.')
+        if skipped:
+            self.message_user(
+                request, f'{skipped} pages were left where they were, as '
+                         f'{category} already has their URL.',
+                messages.WARNING)
+    move_to_category.short_description = \
+        'Move the selected pages to another category'
+
+
+class UserProfileAdmin(ScalableAdmin):
+    list_display = ('user', 'website')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
+
 
 # Register your models here.
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Page, PageAdmin)
-admin.site.register(UserProfile)
+admin.site.register(UserProfile, UserProfileAdmin)
@@ -0,0 +1,215 @@
+import hashlib
+import json
+from functools import wraps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import (Http404, HttpResponse, HttpResponseNotAllowed,
+                         JsonResponse)
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from rango.caching import category_lookup
+from rango.leaderboards import (top_categories, top_pages,
+                                trending_categories, trending_pages)
+from rango.metrics import get_totals
+from rango.models import Category, Event, Like, Page
+from rango.pagination import ORDERS, decode_cursor
+from rango.search import search as search_index
+from rango.trending import log_events, trending as trending_scores
+
+# Fields each kind of object exposes, in the order they are listed.
+# Clients can ask for a subset with ?fields=name,slug
+CATEGORY_FIELDS = ('id', 'name', 'slug', 'views', 'likes')
+PAGE_FIELDS = ('id', 'category', 'title', 'url', 'views')
+
+
+class BadRequest(Exception):
+    pass
+
+
+def api_view(view):
+    # Turn the data returned by an API view into a JSON response with a
+    # strong ETag, answering 304 Not Modified when the client's copy is
+    # current, and invalid parameters into a 400 Bad Request.
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            data = view(request, *args, **kwargs)
+        except BadRequest as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        content = json.dumps(data, cls=DjangoJSONEncoder).encode()
+        etag = quote_etag(hashlib.md5(content).hexdigest())
+        response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(response, max_age=0, must_revalidate=True)
+        return get_conditional_response(request, etag=etag,
+                                        response=response)
+    return wrapper
+
+
+def get_fields(request, allowed):
+    fields = request.GET.get('fields')
+    if not fields:
+        return allowed
+    fields = tuple(field.strip() for field in fields.split(','))
+    unknown = set(fields) - set(allowed)
+    if unknown:
+        raise BadRequest(f'Unknown field(s): {", ".join(sorted(unknown))}')
+    return fields
+
+
+def get_limit(request, default=None, maximum=None):
+    default = default or getattr(settings, 'RANGO_API_PAGE_SIZE', 50)
+    maximum = maximum or getattr(settings, 'RANGO_API_MAX_PAGE_SIZE', 500)
+    try:
+        limit = int(request.GET.get('limit', default))
+    except ValueError:
+        raise BadRequest('limit must be a number')
+    return max(1, min(limit, maximum))
+
+
+def get_category(category_name_slug):
+    row = category_lookup.get_row(category_name_slug)
+    if row is None:
+        raise Http404('The specified category does not exist.')
+    return row
+
+
+@api_view
+def categories(request):
+    # All categories in the order they were added, ?limit= at a time
+    # starting after the ?after= id.
+    fields = get_fields(request, CATEGORY_FIELDS)
+    limit = get_limit(request)
+    queryset = Category.objects.order_by('id')
+    condition = decode_cursor(request.GET.get('after'), 'id')
+    if condition is not None:
+        queryset = queryset.filter(condition)
+
+    rows = list(queryset.values(*set(fields) | {'id'})[:limit + 1])
+    next_cursor = str(rows[limit - 1]['id']) if len(rows) > limit else None
+    return {'results': [{field: row[field] for field in fields}
+                        for row in rows[:limit]],
+            'next': next_cursor}
+
+
+@api_view
+def category(request, category_name_slug):
+    fields = get_fields(request, CATEGORY_FIELDS)
+    row = Category.objects.filter(slug=category_name_slug) \
+        .values(*fields).first()
+    if row is None:
+        raise Http404('The specified category does not exist.')
+    return row
+
+
+@api_view
+def category_pages(request, category_name_slug):
+    # The pages of a category, most viewed first (or ?order=id), ?limit=
+    # at a time starting after the ?after= cursor, as in show_category.
+    fields = get_fields(request, PAGE_FIELDS)
+    limit = get_limit(request)
+    order = request.GET.get('order')
+    order = order if order in ORDERS else 'views'
+
+    queryset = Page.objects.filter(
+        category_id=get_category(category_name_slug)['id']) \
+        .order_by(*ORDERS[order])
+    condition = decode_cursor(request.GET.get('after'), order)
+    if condition is not None:
+        queryset = queryset.filter(condition)
+
+    rows = list(queryset.values(*set(fields) | {'id', 'views'})[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = (f'{last["views"]}_{last["id"]}' if order == 'views'
+                       else str(last['id']))
+    return {'results': [{field: row[field] for field in fields}
+                        for row in rows[:limit]],
+            'next': next_cursor}
+
+
+@api_view
+def top(request):
+    # The index view's most liked categories and most viewed pages,
+    # straight from the precomputed leaderboards
+    return {'categories': top_categories.get(), 'pages': top_pages.get()}
+
+
+@api_view
+def trending(request):
+    # The categories and pages with the most activity lately, with their
+    # time-decayed scores (see rango.trending)
+    return {'categories': trending_scores(trending_categories),
+            'pages': trending_scores(trending_pages)}
+
+
+def like(request, category_name_slug):
+    """
+    The current user's like of a category: GET tells whether they like
+    it, PUT (or POST) likes it and DELETE takes the like back. Liking
+    twice, or unliking a category not liked, changes nothing: the count
+    only moves when a (user, category) row is actually added or removed.
+
+    The row and the count change in one transaction, the count with an
+    F() update, so they can't drift apart and concurrent likes don't
+    overwrite each other. The category's row is only locked until the
+    (short) transaction commits.
+    """
+    if request.method not in ('GET', 'PUT', 'POST', 'DELETE'):
+        return HttpResponseNotAllowed(('GET', 'PUT', 'POST', 'DELETE'))
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Log in to like categories.'},
+                            status=403)
+    category_id = get_category(category_name_slug)['id']
+    likes = Like.objects.filter(user=request.user, category_id=category_id)
+    categories = Category.objects.filter(pk=category_id)
+
+    try:
+        with transaction.atomic():
+            if request.method == 'GET':
+                liked, amount = likes.exists(), 0
+            elif request.method == 'DELETE':
+                deleted, _ = likes.delete()
+                liked, amount = False, -deleted
+            else:
+                _, created = Like.objects.get_or_create(
+                    user=request.user, category_id=category_id)
+                liked, amount = True, int(created)
+            if amount:
+                categories.update(likes=F('likes') + amount)
+                log_events([(Event.CATEGORY_LIKE, category_id, amount)])
+            category = categories.only(*top_categories.fields).first()
+    except IntegrityError:
+        # The category was deleted since we looked it up
+        category = None
+    if category is None:
+        raise Http404('The specified category does not exist.')
+
+    if amount:
+        # update() bypasses the post_save signal
+        top_categories.record(category)
+    return JsonResponse({'liked': liked, 'likes': category.likes})
+
+
+@api_view
+def search(request):
+    query = request.GET.get('q', '').strip()
+    limit = get_limit(request, default=20, maximum=100)
+    return {'query': query,
+            'results': search_index(query, limit) if query else []}
+
+
+def metrics(request):
+    # Per-view request metrics recorded by rango.metrics.MetricsMiddleware
+    # in this process. Only served to staff, and to INTERNAL_IPS if
+    # RANGO_METRICS_FOR_INTERNAL_IPS is set: behind a reverse proxy on the
+    # same host, every request comes from the local host.
+    internal = getattr(settings, 'RANGO_METRICS_FOR_INTERNAL_IPS', False) \
+        and request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS
+    if not (internal or request.user.is_staff):
+        raise Http404
+    return JsonResponse(get_totals())
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class RangoConfig(AppConfig):
     name = 'rango'
+
+    def ready(self):
+        # Importing the signals module connects the receivers that keep
+        # our caches consistent with the database.
+        from rango import signals  # noqa: F401
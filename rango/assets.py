@@ -0,0 +1,141 @@
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+from django.conf import settings
+from django.contrib.staticfiles.storage import (ManifestStaticFilesStorage,
+                                                staticfiles_storage)
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+from rango.images import VARIANT_DIRECTORY
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Files worth compressing: images, fonts and archives already are
+COMPRESSIBLE = ('.css', '.js', '.json', '.html', '.svg', '.txt', '.xml',
+                '.map', '.ico')
+
+# Precompressed variants, in order of preference: Content-Encoding ->
+# file extension
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# A year, the longest lifetime caches are expected to honour
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+ACCEPT_ENCODING = re.compile(r'\s*([\w*-]+)\s*(?:;\s*q=([\d.]+))?')
+
+
+def compress(data):
+    # The precompressed variants of data worth keeping: extension -> bytes
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data)
+    return {extension: compressed
+            for extension, compressed in variants.items()
+            if len(compressed) < len(data) * 0.95}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage (file names carry a hash of their content, so they
+    can be cached forever) which also writes gzip and, when the brotli
+    package is installed, brotli compressed copies of every text file next
+    to it at collectstatic time, for rango.assets.serve (or a front proxy)
+    to send as they are.
+    """
+
+    def post_process(self, *args, **kwargs):
+        yield from super().post_process(*args, **kwargs)
+        if kwargs.get('dry_run'):
+            return
+        names = set(self.hashed_files) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if not name.endswith(COMPRESSIBLE) or not self.exists(name):
+                continue
+            with self.open(name) as f:
+                data = f.read()
+            for extension, compressed in compress(data).items():
+                path = self.path(name + extension)
+                with open(path, 'wb') as f:
+                    f.write(compressed)
+                yield name, name + extension, True
+
+
+def accepted_encodings(request):
+    # Content codings the client accepts (with a non-zero q-value)
+    accepted = set()
+    for match in ACCEPT_ENCODING.finditer(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        coding, quality = match.groups()
+        try:
+            if float(quality or 1) > 0:
+                accepted.add(coding.lower())
+        except ValueError:
+            pass
+    return accepted
+
+
+def is_immutable(path):
+    # Hashed names listed in the static files manifest never change
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', None)
+    return bool(hashed_files) and path in hashed_files.values()
+
+
+def serve(request, path, document_root=None, immutable=is_immutable):
+    """
+    Serve a file below document_root (STATIC_ROOT by default) with cache
+    headers, for deployments without a front proxy.
+
+    Files for which immutable(path) holds are cached for a year, others
+    revalidated with If-Modified-Since. The brotli or gzip variant written
+    by CompressedManifestStaticFilesStorage is sent in place of the file
+    when the client accepts it.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    fullpath = safe_join(document_root or settings.STATIC_ROOT, path)
+    if not os.path.isfile(fullpath):
+        raise Http404(f'"{path}" does not exist')
+
+    statobj = os.stat(fullpath)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                              statobj.st_mtime, statobj.st_size):
+        response = HttpResponseNotModified()
+    else:
+        content_type, encoding = mimetypes.guess_type(fullpath)
+        filename, content_encoding = fullpath, encoding
+        if encoding is None and path.endswith(COMPRESSIBLE):
+            accepted = accepted_encodings(request)
+            for coding, extension in ENCODINGS:
+                if coding in accepted and \
+                        os.path.isfile(fullpath + extension):
+                    filename, content_encoding = fullpath + extension, coding
+                    break
+        response = FileResponse(open(filename, 'rb'),
+                                content_type=content_type or
+                                'application/octet-stream')
+        response['Last-Modified'] = http_date(statobj.st_mtime)
+        if content_encoding:
+            response['Content-Encoding'] = content_encoding
+
+    if path.endswith(COMPRESSIBLE):
+        patch_vary_headers(response, ['Accept-Encoding'])
+    if immutable(path):
+        patch_cache_control(response, public=True,
+                            max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=0,
+                            must_revalidate=True)
+    return response
+
+
+def is_media_immutable(path):
+    # Profile picture variants are named after their content (see
+    # rango.images), other uploads may be replaced
+    return path.startswith(VARIANT_DIRECTORY + '/')
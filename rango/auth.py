@@ -0,0 +1,127 @@
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, make_password
+from rango import caching
+
+_executor = None
+_executor_lock = Lock()
+
+
+def run_hasher(func, *args):
+    """
+    Run a password hashing function on the bounded hasher pool.
+
+    Hashing is CPU-bound (and releases the GIL), so capping the number of
+    hashes computed at once at RANGO_PASSWORD_WORKERS keeps a burst of
+    logins from starving the threads serving other requests. With
+    RANGO_PASSWORD_WORKERS = 0 the function runs in the calling thread.
+    """
+    global _executor
+    workers = getattr(settings, 'RANGO_PASSWORD_WORKERS', 4)
+    if not workers:
+        return func(*args)
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(workers,
+                                           thread_name_prefix='rango-hasher')
+    return _executor.submit(func, *args).result()
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    The model backend, with the password checked on the hasher pool.
+
+    Only the hashing runs there: the user is looked up (and a hash made
+    with outdated parameters is replaced) in the request's own thread and
+    database connection.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hash the password anyway, so the response time doesn't tell
+            # whether the username exists.
+            run_hasher(make_password, password)
+            return None
+
+        outdated = []
+        if (run_hasher(check_password, password, user.password,
+                       outdated.append)
+                and self.user_can_authenticate(user)):
+            if outdated:
+                # Rehash with the preferred hasher and current costs
+                user.password = run_hasher(make_password, password)
+                user.save(update_fields=['password'])
+            return user
+        return None
+
+
+class RateLimiter:
+    """
+    Counts attempts per key (e.g. per client IP) in fixed windows of
+    time, held in Rango's cache, and refuses them beyond a limit.
+
+    The limit is read from RANGO_LOGIN_RATE_LIMITS[name] as (attempts,
+    seconds); a missing entry disables the limiter.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    @property
+    def limit(self):
+        return getattr(settings, 'RANGO_LOGIN_RATE_LIMITS', {}).get(self.name)
+
+    def key(self, value, window):
+        digest = hashlib.md5(str(value).encode()).hexdigest()
+        return f'{caching.KEY_PREFIX}:ratelimit:{self.name}:{digest}:{window}'
+
+    def hit(self, value):
+        # Record an attempt, returning the number of seconds to wait
+        # before trying again if it goes over the limit (otherwise 0)
+        if self.limit is None:
+            return 0
+        attempts, period = self.limit
+        now = time.time()
+        window = int(now // period)
+        key = self.key(value, window)
+        cache = caching.get_cache()
+        cache.add(key, 0, period)
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # The window expired between add() and incr()
+            cache.set(key, 1, period)
+            count = 1
+        if count > attempts:
+            return int(period - now % period) + 1
+        return 0
+
+    def reset(self, value):
+        if self.limit is not None:
+            window = int(time.time() // self.limit[1])
+            caching.get_cache().delete(self.key(value, window))
+
+
+login_by_ip = RateLimiter('ip')
+login_by_username = RateLimiter('username')
+
+
+def check_login_rate(request, username):
+    """
+    Record a login attempt, returning the number of seconds the client
+    must wait if it has made too many (per IP or per username), or 0.
+    """
+    return max(login_by_ip.hit(request.META.get('REMOTE_ADDR')),
+               login_by_username.hit(username or ''))
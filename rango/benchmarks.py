@@ -0,0 +1,508 @@
+import copy
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import partial
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin import ModelAdmin
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.contrib.staticfiles.views import serve as staticfiles_serve
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, Q
+from django.template import loader
+from django.template.defaultfilters import slugify
+from django.test import Client, RequestFactory, override_settings
+from django.test.utils import (CaptureQueriesContext, setup_test_environment,
+                               teardown_test_environment)
+from django.urls import reverse
+from django.utils import timezone
+from rango import assets, caching, search, trending
+from rango.leaderboards import (top_categories, top_pages,
+                                trending_categories, trending_pages)
+from rango.models import Category, Event, Page
+from rango.pagination import KeysetPage
+from rango.sessions import SessionStore
+from rango.templatetags import rango_template_tags
+
+# Registry of the available benchmarks, filled in by the @benchmark
+# decorator below and run by the benchmark_rango management command.
+BENCHMARKS = {}
+
+
+def benchmark(name, on_disk=False):
+    # on_disk: the benchmark needs its database in a file (see
+    # throwaway_database)
+    def decorator(func):
+        func.on_disk = on_disk
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+@contextmanager
+def throwaway_database(on_disk=False):
+    """
+    Run the enclosed code against a freshly migrated test database, which
+    is destroyed afterwards, so benchmarks never touch the real data.
+
+    With on_disk, the (SQLite) test database is a temporary file rather
+    than in memory, so other threads - e.g. a live server - get their own
+    connections to it.
+    """
+    setup_test_environment()
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    directory = None
+    if on_disk and connection.vendor == 'sqlite':
+        directory = tempfile.mkdtemp()
+        test_settings['NAME'] = os.path.join(directory, 'rango.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if directory:
+            shutil.rmtree(directory)
+            test_settings['NAME'] = old_test_name
+        teardown_test_environment()
+
+
+def topic(category_id, i):
+    # A pseudo-random word out of 5,000 for each page, so searches have
+    # selective terms to look for
+    return f'topic{(i * 7919 + category_id * 104729) % 5000}'
+
+
+def seed(categories=20, pages_per_category=50):
+    # Fill the (throwaway) database with synthetic categories and pages.
+    # bulk_create() skips Category.save(), so we compute the slugs here.
+    Category.objects.bulk_create([
+        Category(name=f'Category {i}', slug=slugify(f'Category {i}'),
+                 views=i, likes=i)
+        for i in range(categories)
+    ])
+    for category in Category.objects.all():
+        Page.objects.bulk_create([
+            Page(category=category,
+                 title=f'{category.name} page {i} {topic(category.id, i)}',
+                 url=f'http://example.com/{category.slug}/{i}/', views=i)
+            for i in range(pages_per_category)
+        ], batch_size=500)
+
+
+def timed(func, repeat=10):
+    # Mean wall-clock time of func() in milliseconds
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def count_queries(client, url):
+    with CaptureQueriesContext(connection) as queries:
+        client.get(url)
+    return len(queries)
+
+
+@benchmark('queries')
+def queries_per_request(requests=10, **options):
+    # Queries per request for the pages that extend base.html, with the
+    # sidebar cache cleared before every request ("cold", i.e. how the
+    # site behaved without the cache) and with it warm.
+    slug = Category.objects.values_list('slug', flat=True).first()
+    urls = {
+        'index': reverse('rango:index'),
+        'show_category': reverse('rango:show_category', args=[slug]),
+        'about': reverse('rango:about'),
+    }
+    client = Client()
+    results = {}
+    for name, url in urls.items():
+        cold = []
+        for _ in range(requests):
+            caching.get_cache().clear()
+            cold.append(count_queries(client, url))
+        warm = [count_queries(client, url) for _ in range(requests)]
+        results[name] = {'cold': sum(cold) / requests,
+                         'warm': sum(warm) / requests}
+    return results
+
+
+@benchmark('leaderboards')
+def leaderboards(requests=10, **options):
+    # Time taken to produce the index view's two top-5 lists: as a full
+    # sort (ordering by an expression, so no index can be used), as an
+    # indexed ORDER BY ... LIMIT, and from the precomputed leaderboards.
+    results = {'pages': Page.objects.count()}
+    results['full_sort_ms'] = timed(lambda: (
+        list(Category.objects.order_by((F('likes') + 0).desc())[:5]),
+        list(Page.objects.order_by((F('views') + 0).desc())[:5]),
+    ), requests)
+    results['indexed_ms'] = timed(lambda: (
+        list(Category.objects.order_by('-likes')[:5]),
+        list(Page.objects.order_by('-views')[:5]),
+    ), requests)
+    top_categories.get()
+    top_pages.get()
+    results['leaderboard_ms'] = timed(lambda: (
+        top_categories.get(), top_pages.get(),
+    ), requests)
+    return results
+
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'rango': 'rango.sessions',
+}
+
+
+@benchmark('sessions')
+def session_writes(visitors=100, **options):
+    # Database writes per 1,000 anonymous page views (alternating index
+    # and about), spread over the given number of visitors, for each of
+    # the session engines.
+    urls = [reverse('rango:index'), reverse('rango:about')]
+    views_per_visitor = 1000 // visitors
+    results = {}
+    for engine, module in SESSION_ENGINES.items():
+        with override_settings(SESSION_ENGINE=module):
+            writes = 0
+            for _ in range(visitors):
+                client = Client()
+                for i in range(views_per_visitor):
+                    with CaptureQueriesContext(connection) as queries:
+                        client.get(urls[i % 2])
+                    writes += sum(1 for q in queries
+                                  if q['sql'].startswith(('INSERT', 'UPDATE',
+                                                          'DELETE')))
+            results[engine] = writes
+
+    # Deleting a backlog of expired sessions a batch at a time
+    expired = timezone.now() - timedelta(days=1)
+    Session.objects.bulk_create(
+        [Session(session_key=f'expired{i:025}', session_data='',
+                 expire_date=expired) for i in range(100000)],
+        batch_size=500)
+    start = time.perf_counter()
+    deleted = SessionStore.clear_expired(batch_size=1000)
+    elapsed = time.perf_counter() - start
+    results['clear_expired'] = {'sessions': deleted, 'seconds': elapsed,
+                                'batch_ms': elapsed * 1000 / 100}
+    return results
+
+
+@benchmark('category_listing')
+def category_listing(requests=10, **options):
+    # Time to render the first and the last page of the largest category
+    # (with the page cache cleared), and to stream all of it.
+    category = Category.objects.order_by('-id').first()
+    url = reverse('rango:show_category', args=[category.slug])
+    last = Page.objects.filter(category=category).order_by('views', 'id')[1]
+    client = Client()
+
+    def get(data=None):
+        caching.get_cache().clear()
+        client.get(url, data)
+
+    def export():
+        response = client.get(reverse('rango:export_category',
+                                      args=[category.slug]))
+        for _ in response.streaming_content:
+            pass
+
+    return {
+        'pages': Page.objects.filter(category=category).count(),
+        'first_page_ms': timed(get, requests),
+        'last_page_ms': timed(lambda: get(
+            {'after': f'{last.views}_{last.id}'}), requests),
+        'export_ms': timed(export, 1),
+    }
+
+
+SEARCH_QUERIES = ('topic4321', 'topic123 category 7', 'topic42 page')
+
+
+@benchmark('search')
+def search_latency(requests=10, **options):
+    # Mean latency of a few searches with each index, and with the naive
+    # icontains filter over every word the search would replace.
+    def icontains(query):
+        condition = Q()
+        for word in query.split():
+            condition &= Q(title__icontains=word) | Q(url__icontains=word)
+        return list(Page.objects.filter(condition).order_by('-views')[:20])
+
+    results = {'pages': Page.objects.count()}
+    # seed() bypasses the signals that maintain the index
+    start = time.perf_counter()
+    search.FTS5Index().rebuild()
+    results['fts5_build_ms'] = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    search._memory_index.rebuild()
+    results['memory_build_ms'] = (time.perf_counter() - start) * 1000
+
+    for backend in ('fts5', 'memory'):
+        with override_settings(RANGO_SEARCH_BACKEND=backend):
+            results[f'{backend}_ms'] = {
+                query: timed(lambda: search.search(query), requests)
+                for query in SEARCH_QUERIES
+            }
+    results['icontains_ms'] = {
+        query: timed(lambda: icontains(query), requests)
+        for query in SEARCH_QUERIES
+    }
+    return results
+
+
+@benchmark('api')
+def api_throughput(requests=100, **options):
+    # Requests per second for the JSON API against the HTML views that
+    # show the same data, plus the API answering conditional GETs
+    slug = Category.objects.values_list('slug', flat=True).first()
+    pairs = {
+        'top': (reverse('rango:index'), reverse('rango:api_top')),
+        'category_pages': (
+            reverse('rango:show_category', args=[slug]),
+            reverse('rango:api_category_pages', args=[slug]) + '?limit=20'),
+    }
+    client = Client()
+    results = {}
+    for name, (html, api) in pairs.items():
+        etag = client.get(api)['ETag']
+        results[name] = {
+            'html_rps': 1000 / timed(lambda: client.get(html), requests),
+            'api_rps': 1000 / timed(lambda: client.get(api), requests),
+            'api_304_rps': 1000 / timed(lambda: client.get(
+                api, HTTP_IF_NONE_MATCH=etag), requests),
+        }
+    return results
+
+
+@benchmark('static')
+def static_assets(requests=100, **options):
+    # Serving a stylesheet and an image: through the development server's
+    # staticfiles view (finders, no cache headers) against the collected,
+    # hashed and precompressed files served by rango.assets. A stylesheet
+    # of 2,000 rules stands in for the site's (so far nonexistent) CSS.
+    source = tempfile.mkdtemp()
+    static_root = tempfile.mkdtemp()
+    try:
+        os.mkdir(os.path.join(source, 'css'))
+        with open(os.path.join(source, 'css', 'rango.css'), 'w') as f:
+            f.writelines(f'.rule-{i} {{ margin: {i % 7}px; }}\n'
+                         for i in range(2000))
+        with override_settings(
+                STATICFILES_DIRS=list(settings.STATICFILES_DIRS) + [source],
+                STATIC_ROOT=static_root,
+                STATICFILES_STORAGE=
+                'rango.assets.CompressedManifestStaticFilesStorage'):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            factory = RequestFactory(HTTP_ACCEPT_ENCODING='gzip, br')
+            results = {}
+            for path in ('css/rango.css', 'images/rango.jpg'):
+                hashed = staticfiles_storage.stored_name(path)
+
+                def get(view, path):
+                    response = view(factory.get(f'/static/{path}'), path)
+                    size = sum(len(chunk)
+                               for chunk in response.streaming_content)
+                    response.close()
+                    return response, size
+
+                development = partial(staticfiles_serve, insecure=True)
+                response, size = get(development, path)
+                results[path] = {'development': {
+                    'ms': timed(lambda: get(development, path), requests),
+                    'bytes': size,
+                    'cache_control': response.get('Cache-Control'),
+                }}
+                response, size = get(assets.serve, hashed)
+                results[path]['assets'] = {
+                    'ms': timed(lambda: get(assets.serve, hashed), requests),
+                    'bytes': size,
+                    'cache_control': response.get('Cache-Control'),
+                }
+            return results
+    finally:
+        shutil.rmtree(source)
+        shutil.rmtree(static_root)
+
+
+def template_settings(cached):
+    # TEMPLATES and RANGO_CACHE_TEMPLATES, with or without the compiled
+    # templates and rendered navigation kept in memory, as settings.py
+    # sets them up
+    templates = copy.deepcopy(settings.TEMPLATES)
+    templates[0]['APP_DIRS'] = not cached
+    templates[0]['OPTIONS'].pop('loaders', None)
+    if cached:
+        templates[0]['OPTIONS']['loaders'] = copy.deepcopy(
+            settings.RANGO_CACHED_TEMPLATE_LOADERS)
+    return {'TEMPLATES': templates, 'RANGO_CACHE_TEMPLATES': cached}
+
+
+def profile_settings(production):
+    # The settings that differ between the development and the
+    # production profiles (see RANGO_ENV in settings.py)
+    return {
+        'DEBUG': not production,
+        **template_settings(production),
+        'RANGO_SQLITE_PRAGMAS': (settings.RANGO_PRODUCTION_SQLITE_PRAGMAS
+                                 if production else {}),
+    }
+
+
+@benchmark('profiles', on_disk=True)
+def settings_profiles(requests=100, **options):
+    # Requests per second for the index view through Django's WSGI
+    # handler (which closes the database connection after each request
+    # unless CONN_MAX_AGE says otherwise), with the development settings
+    # and with the production ones.
+    environ = RequestFactory()._base_environ(PATH_INFO=reverse('rango:index'))
+    results = {}
+    for name, production, conn_max_age in (('development', False, 0),
+                                           ('production', True, 600)):
+        connection.close()
+        old_conn_max_age = connection.settings_dict['CONN_MAX_AGE']
+        connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+        try:
+            with override_settings(**profile_settings(production)):
+                handler = WSGIHandler()
+
+                def get():
+                    handler(dict(environ), lambda status, headers: None) \
+                        .close()
+
+                get()
+                results[name] = {'index_rps': 1000 / timed(get, requests)}
+        finally:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = old_conn_max_age
+    return results
+
+
+@benchmark('rendering')
+def rendering(requests=100, **options):
+    # Time to render index.html and category.html (for an anonymous and
+    # a logged-in user) with templates compiled on every render, as in
+    # development, and kept in memory along with the rendered navigation.
+    category = Category.objects.order_by('-id').first()
+    contexts = {
+        'rango/index.html': {
+            'boldmessage': 'Crunchy, creamy, cookie, candy, cupcake!',
+            'categories': top_categories.get(), 'pages': top_pages.get()},
+        'rango/category.html': {
+            'category': category, 'order': 'views',
+            'pages': KeysetPage(Page.objects.filter(category=category),
+                                'views', None,
+                                settings.RANGO_CATEGORY_PAGE_SIZE),
+            'pages_version': caching.get_category_version(category.slug),
+            'cache_alias': caching.get_cache_alias()},
+    }
+    users = {'anonymous': AnonymousUser(),
+             'authenticated': User(username='benchmark')}
+    results = {}
+    for cached in (False, True):
+        with override_settings(**template_settings(cached)):
+            rango_template_tags._navigation.clear()
+            for name, context in contexts.items():
+                for state, user in users.items():
+                    request = RequestFactory().get('/')
+                    request.user = user
+
+                    def render():
+                        loader.get_template(name).render(context, request)
+
+                    render()
+                    results.setdefault(name, {}).setdefault(state, {})[
+                        'cached_ms' if cached else 'uncached_ms'] = \
+                        timed(render, requests)
+    return results
+
+
+def log_synthetic_events(events):
+    # events page views, spread over every page and the last two days,
+    # inserted with one executemany() rather than through the ORM
+    page_ids = list(Page.objects.values_list('id', flat=True))
+    now = timezone.now()
+    table = connection.ops.quote_name(Event._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} (kind, object_id, count, created) '
+            f'VALUES (%s, %s, %s, %s)',
+            [(Event.PAGE_VIEW, page_ids[i * 7919 % len(page_ids)], 1,
+              connection.ops.adapt_datetimefield_value(
+                  now - timedelta(seconds=i * 7 % (48 * 60 * 60))))
+             for i in range(events)])
+
+
+@benchmark('trending')
+@override_settings(RANGO_TRENDING_ROLLUP_DELAY=0)
+def trending_rollup(events=100000, **options):
+    # Throughput of rolling a backlog of events up into hourly counts and
+    # trending scores, and the cost of the next (small) roll-up, which
+    # only reads the events logged since: it doesn't grow with the log.
+    # (Without the delay, so that every event logged is rolled up.)
+    log_synthetic_events(events)
+    start = time.perf_counter()
+    trending.roll_up()
+    elapsed = time.perf_counter() - start
+    results = {'events': events,
+               'rollup_s': elapsed,
+               'events_per_s': events / elapsed}
+
+    log_synthetic_events(1000)
+    start = time.perf_counter()
+    trending.roll_up()
+    results['next_1000_events_ms'] = (time.perf_counter() - start) * 1000
+    results['read_ms'] = timed(lambda: (
+        trending.trending(trending_categories),
+        trending.trending(trending_pages)))
+    return results
+
+
+@benchmark('admin')
+def admin_changelist(requests=10, **options):
+    # Time to load the page change list: its first page, the page half
+    # way through (by OFFSET, or by cursor) and a search, with Django's
+    # default admin options and with rango.admin's. Seed --pages per
+    # category to size the table, e.g. --categories 100 --pages 10000.
+    user = User.objects.create_superuser('benchmark', 'benchmark@example.com',
+                                         'benchmark')
+    # seed() bypasses the signals that maintain the search index
+    search.rebuild()
+    total = Page.objects.count()
+    middle = max(total // 200, 1)  # of 100-row pages
+    deep = Page.objects.order_by('-pk').values_list('pk', flat=True)[
+        middle * 100 - 1]
+
+    default = ModelAdmin(Page, admin.site)
+    default.list_display = ('title', 'category', 'url')
+    default.search_fields = ('title', 'url')
+    results = {'pages': total}
+    for name, model_admin, deep_params in (
+            ('default', default, {'p': middle}),
+            ('rango', admin.site._registry[Page], {'after': deep})):
+        for page, params in (('first', {}), ('deep', deep_params),
+                             ('search', {'q': 'topic42'})):
+            def get():
+                request = RequestFactory().get('/admin/rango/page/', params)
+                request.user = user
+                response = model_admin.changelist_view(request)
+                response.render()
+                assert len(response.context_data['cl'].result_list)
+
+            get()
+            results.setdefault(name, {})[f'{page}_ms'] = timed(get, requests)
+    return results
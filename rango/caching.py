@@ -0,0 +1,254 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rango.metrics import filling_cache
+from rango.models import Category
+from rango.routers import primary
+
+# Every cache key used by Rango starts with this prefix, so the entries
+# are easy to spot when sharing a cache with other applications.
+KEY_PREFIX = 'rango'
+
+CATEGORY_LIST_VERSION_KEY = f'{KEY_PREFIX}:category_list:version'
+
+
+def get_cache_alias():
+    # The cache alias is configurable, so the sidebar can live in the
+    # local-memory cache during development and in a shared cache
+    # (memcached, redis, ...) in production.
+    return getattr(settings, 'RANGO_CACHE_ALIAS', 'default')
+
+
+def get_cache():
+    return caches[get_cache_alias()]
+
+
+def new_version():
+    # A version counter that was evicted (or never set) starts again from
+    # the time in nanoseconds: past any version it had before, as it is
+    # bumped by one per write, so entries cached under those versions
+    # can't come back.
+    return time.time_ns()
+
+
+def get_version(key):
+    # Version counters never expire; they are only ever bumped.
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    # Bumping the version makes every entry built from the old version
+    # unreachable, so stale data can never be served after a write.
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, new_version(), timeout=None)
+
+
+def get_category_list():
+    # Return the sidebar entries as a list of dictionaries with the
+    # category name, slug and precomputed URL. The list is rebuilt from
+    # the database only when a category has changed since it was cached.
+    cache = get_cache()
+    version = get_version(CATEGORY_LIST_VERSION_KEY)
+    key = f'{KEY_PREFIX}:category_list:{version}'
+
+    categories = cache.get(key)
+    if categories is None:
+        with primary(), filling_cache():
+            categories = [
+                {'name': name,
+                 'slug': slug,
+                 'url': reverse('rango:show_category', args=[slug])}
+                for name, slug in Category.objects.values_list('name',
+                                                               'slug')
+            ]
+        cache.set(key, categories,
+                  getattr(settings, 'RANGO_CATEGORY_LIST_TIMEOUT', 60 * 60))
+    return categories
+
+
+def invalidate_category_list():
+    bump_version(CATEGORY_LIST_VERSION_KEY)
+
+
+def category_version_key(slug):
+    return f'{KEY_PREFIX}:category:{slug}:version'
+
+
+def get_category_version(slug):
+    # Version of the pages listed in the category with the given slug
+    return get_version(category_version_key(slug))
+
+
+def invalidate_category(slug):
+    bump_version(category_version_key(slug))
+
+
+def category_page_key(request, category_name_slug):
+    # A category page shows the sidebar as well as the category's pages,
+    # so its cache key changes whenever either of them does. Each order
+    # and position in the list of pages is cached separately.
+    listing = hashlib.md5(
+        f'{request.GET.get("order")}:{request.GET.get("after")}'.encode()
+    ).hexdigest()
+    return (f'{KEY_PREFIX}:category_page:{category_name_slug}:{listing}:'
+            f'{get_version(CATEGORY_LIST_VERSION_KEY)}:'
+            f'{get_category_version(category_name_slug)}')
+
+
+def cache_anonymous_page(key_func):
+    """
+    Cache the responses a view gives to anonymous users, who all see the
+    same page, under the key returned by key_func(request, **kwargs),
+    where kwargs are the view's arguments. Cached responses carry an
+    ETag and Last-Modified header, so browsers can revalidate them and
+    get a 304 Not Modified back. Authenticated users always get the view
+    itself.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or \
+                    request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+
+            cache = get_cache()
+            key = key_func(request, *args, **kwargs)
+            entry = cache.get(key)
+            if entry is None:
+                # The page is cached, so it must not come from a replica
+                # (see rango.routers.primary)
+                with primary():
+                    response = view(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming or \
+                        response.cookies:
+                    return response
+                entry = {
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                    'etag': quote_etag(
+                        hashlib.md5(response.content).hexdigest()),
+                    'last_modified': int(time.time()),
+                }
+                cache.set(key, entry, getattr(
+                    settings, 'RANGO_PAGE_CACHE_TIMEOUT', 60 * 60))
+
+            response = HttpResponse(entry['content'],
+                                    content_type=entry['content_type'])
+            response['ETag'] = entry['etag']
+            response['Last-Modified'] = http_date(entry['last_modified'])
+            # Let browsers keep the page, but ask them to check back
+            # (cheaply, thanks to the validators) every time.
+            patch_cache_control(response, max_age=0, must_revalidate=True)
+            return get_conditional_response(
+                request, etag=entry['etag'],
+                last_modified=entry['last_modified'], response=response)
+        return wrapper
+    return decorator
+
+
+class CategoryLookup:
+    """
+    Maps category slugs to categories for the views addressed by slug,
+    without a query for the hot ones.
+
+    Rows are kept in an in-process LRU of at most RANGO_CATEGORY_LOOKUP_SIZE
+    entries, each for RANGO_CATEGORY_LOOKUP_TIMEOUT seconds, backed (with
+    RANGO_CATEGORY_LOOKUP_SHARED) by Rango's cache so that processes share
+    their lookups. Unknown slugs are remembered too, for
+    RANGO_CATEGORY_LOOKUP_MISS_TIMEOUT seconds, so requests for random
+    slugs don't all reach the database.
+
+    The signals in rango.signals forget a category when it is saved or
+    deleted. Other processes' LRUs only notice after their timeout, which
+    is why it is short; views and likes, updated in bulk without signals,
+    can also be that old.
+    """
+
+    FIELDS = ('id', 'name', 'slug', 'views', 'likes', 'trend')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def key(self, slug):
+        return f'{KEY_PREFIX}:category_lookup:{slug}'
+
+    def get(self, slug):
+        # The category with the given slug, raising Category.DoesNotExist
+        # like Category.objects.get(slug=slug)
+        row = self.get_row(slug)
+        if row is None:
+            raise Category.DoesNotExist(
+                f'Category matching slug {slug!r} does not exist.')
+        category = Category(**row)
+        category._state.adding = False
+        return category
+
+    def get_row(self, slug):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(slug)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(slug)
+                return entry[1]
+
+        shared = getattr(settings, 'RANGO_CATEGORY_LOOKUP_SHARED', False)
+        # Misses are stored in the shared cache as False, as None means
+        # the cache has no entry
+        row = get_cache().get(self.key(slug)) if shared else None
+        if row is None:
+            with primary(), filling_cache():
+                row = Category.objects.filter(slug=slug) \
+                    .values(*self.FIELDS).first() or False
+            if shared:
+                get_cache().set(self.key(slug), row, self.timeout(row))
+        self.store(slug, row or None, now + self.timeout(row))
+        return row or None
+
+    def timeout(self, row):
+        if row:
+            return getattr(settings, 'RANGO_CATEGORY_LOOKUP_TIMEOUT', 60)
+        return getattr(settings, 'RANGO_CATEGORY_LOOKUP_MISS_TIMEOUT', 10)
+
+    def store(self, slug, row, expires):
+        with self.lock:
+            self.entries[slug] = (expires, row)
+            self.entries.move_to_end(slug)
+            size = getattr(settings, 'RANGO_CATEGORY_LOOKUP_SIZE', 1000)
+            while len(self.entries) > size:
+                self.entries.popitem(last=False)
+
+    def forget(self, category):
+        # Forget the category under its current slug (it may have been
+        # remembered as missing) and under any previous one.
+        with self.lock:
+            slugs = {category.slug} | {
+                slug for slug, (_, row) in self.entries.items()
+                if row and row['id'] == category.pk}
+            for slug in slugs:
+                self.entries.pop(slug, None)
+        if getattr(settings, 'RANGO_CATEGORY_LOOKUP_SHARED', False):
+            get_cache().delete_many([self.key(slug) for slug in slugs])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+category_lookup = CategoryLookup()
@@ -0,0 +1,123 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from rango import caching, trending
+from rango.leaderboards import LEADERBOARDS
+from rango.models import Page
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+    """
+    Accumulates counter increments (e.g. Page.views) in memory and writes
+    them to the database in batches, rather than issuing one UPDATE per
+    hit.
+
+    Increments are flushed every RANGO_COUNTER_FLUSH_INTERVAL seconds by a
+    background thread, as soon as RANGO_COUNTER_MAX_PENDING distinct rows
+    are pending, and when the process exits. At most one interval's worth
+    of increments can therefore be lost if the process is killed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = defaultdict(int)
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def increment(self, model, pk, field, amount=1):
+        with self.lock:
+            self.pending[(model, field, pk)] += amount
+            full = len(self.pending) >= getattr(
+                settings, 'RANGO_COUNTER_MAX_PENDING', 1000)
+            self.start()
+        if full:
+            self.flush()
+
+    def start(self):
+        # Start the flushing thread on first use (called with the lock
+        # held). An interval of 0 disables it, leaving flushing to the
+        # size bound, the exit hook and explicit flush() calls.
+        interval = getattr(settings, 'RANGO_COUNTER_FLUSH_INTERVAL', 5)
+        if self.thread is None and interval:
+            self.thread = threading.Thread(target=self.run, args=(interval,),
+                                           name='rango-counters', daemon=True)
+            self.thread.start()
+
+    def run(self, interval):
+        while not self.stopped.wait(interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Could not flush Rango counters')
+
+    def flush(self):
+        # Swap the pending increments out under the lock, so hits keep
+        # being counted while we write.
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(int)
+        if not pending:
+            return 0
+
+        # Rows receiving the same increment share one UPDATE statement.
+        batches = defaultdict(list)
+        for (model, field, pk), amount in pending.items():
+            batches[(model, field, amount)].append(pk)
+
+        try:
+            with transaction.atomic():
+                for (model, field, amount), pks in batches.items():
+                    model.objects.filter(pk__in=pks).update(
+                        **{field: F(field) + amount})
+                # Log the increments for the trending scores too, one
+                # event per row and flush rather than per hit
+                trending.log_events(
+                    (trending.COUNTER_EVENTS[(model, field)], pk, amount)
+                    for (model, field, pk), amount in pending.items()
+                    if (model, field) in trending.COUNTER_EVENTS)
+        except Exception:
+            # Put the increments back so the next flush retries them.
+            with self.lock:
+                for key, amount in pending.items():
+                    self.pending[key] += amount
+            raise
+
+        # update() bypasses the post_save signal, so bring the affected
+        # leaderboards up to date ourselves.
+        for leaderboard in LEADERBOARDS:
+            pks = [pk for (model, field, pk) in pending
+                   if model is leaderboard.model and field == leaderboard.field]
+            if pks:
+                for instance in leaderboard.model.objects \
+                        .filter(pk__in=pks).only(*leaderboard.fields):
+                    leaderboard.record(instance)
+
+        # Categories list their pages by views, so the cached pages of the
+        # categories whose pages were viewed are now out of date.
+        pks = [pk for (model, field, pk) in pending if model is Page]
+        if pks:
+            for slug in Page.objects.filter(pk__in=pks) \
+                    .values_list('category__slug', flat=True).distinct():
+                caching.invalidate_category(slug)
+
+        return len(pending)
+
+    def stop(self):
+        self.stopped.set()
+        self.flush()
+
+
+counters = CounterBuffer()
+
+
+@atexit.register
+def flush_on_shutdown():
+    try:
+        counters.stop()
+    except Exception:
+        logger.exception('Could not flush Rango counters on shutdown')
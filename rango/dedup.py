@@ -0,0 +1,90 @@
+from django.db import connection, transaction
+from rango.loader import invalidate_caches
+from rango.models import Category, Page
+from rango.urlnorm import url_hash
+
+
+def merge_batch(pages):
+    """
+    Key the given (id, category_id, url, views) pages by canonical URL,
+    merging those that duplicate each other, or a page already keyed,
+    into one page of their category which gets their summed views. The
+    page kept keeps its URL as it was entered. Returns the number of
+    pages merged away, and the ids of the categories they were in.
+    """
+    groups = {}
+    for id, category_id, url, views in pages:
+        groups.setdefault((url_hash(url), category_id), []).append(
+            (id, views))
+
+    # Pages already keyed (saved since the column was added, or merged in
+    # an earlier batch) which these pages duplicate
+    keyed = {(page['url_hash'], page['category_id']): page['id']
+             for page in Page.objects.filter(
+                 url_hash__in={key for key, _ in groups})
+             .values('id', 'url_hash', 'category_id')}
+
+    new_keys = []
+    added_views = []
+    merged = []
+    categories = set()
+    for (key, category_id), duplicates in groups.items():
+        survivor = keyed.get((key, category_id))
+        if survivor is None:
+            # The oldest page stays
+            (survivor, _), duplicates = duplicates[0], duplicates[1:]
+            new_keys.append((key, survivor))
+        merged += [id for id, _ in duplicates]
+        if duplicates:
+            categories.add(category_id)
+        total = sum(views for _, views in duplicates)
+        if total:
+            added_views.append((total, survivor))
+
+    # As in rango.loader.update_pages, an executemany() of a plain UPDATE
+    # is far cheaper than bulk_update()'s CASE WHEN per row.
+    table = connection.ops.quote_name(Page._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {table} WHERE id = %s',
+                           [(id,) for id in merged])
+        cursor.executemany(
+            f'UPDATE {table} SET url_hash = %s WHERE id = %s',
+            new_keys)
+        cursor.executemany(
+            f'UPDATE {table} SET views = views + %s WHERE id = %s',
+            added_views)
+    return len(merged), categories
+
+
+def merge_duplicates(batch_size=5000):
+    """
+    Key every page saved before Page.url_hash existed, merging the pages
+    of a category that share a canonical URL.
+
+    The pages are read in id order, batch_size at a time, and each batch
+    is merged in its own transaction, so memory use stays the same however
+    large the table is and an interrupted run can simply be restarted.
+    Returns the number of pages examined and merged away.
+    """
+    examined = merged = 0
+    categories = set()
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            pages = list(Page.objects
+                         .filter(url_hash__isnull=True, id__gt=last_id)
+                         .order_by('id')
+                         .values_list('id', 'category_id', 'url', 'views')
+                         [:batch_size])
+            if not pages:
+                break
+            batch_merged, batch_categories = merge_batch(pages)
+        merged += batch_merged
+        categories |= batch_categories
+        examined += len(pages)
+        last_id = pages[-1][0]
+
+    if merged or examined:
+        invalidate_caches(Category.objects.filter(pk__in=categories)
+                          .values_list('slug', flat=True))
+    return {'pages': examined, 'merged': merged}
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.models import User
 from rango.models import Page, Category, UserProfile
+from rango.urlnorm import HAS_SCHEME, url_hash
 
 class CategoryForm(forms.ModelForm):
     name = forms.CharField(max_length=Category.NAME_MAX_LENGTH,
@@ -28,15 +29,27 @@ class PageForm(forms.ModelForm):
         # Exclude the category field, our foreign key, from our form
         exclude = ('category',)
 
+    def __init__(self, *args, category=None, **kwargs):
+        # The category the page is added to, checked for the same URL
+        super().__init__(*args, **kwargs)
+        self.category = category
+
     def clean(self):
         cleaned_data = self.cleaned_data
         url = cleaned_data.get('url')
 
-        # If url is not empty and doesn't start with 'http://', then
-        # prepend 'http://'
-        if url and not url.startswith('http://'):
-            url = f'http://{url}'
-            cleaned_data['url'] = url
+        if url:
+            # Keep the URL as it was entered, prepending 'http://' if it
+            # has no scheme
+            if not HAS_SCHEME.match(url):
+                url = f'http://{url}'
+                cleaned_data['url'] = url
+
+            # A single indexed lookup on the key of the URL's canonical
+            # form, so the same page written another way is found too
+            if self.category is not None and Page.objects.filter(
+                    category=self.category, url_hash=url_hash(url)).exists():
+                self.add_error('url', 'This page is already in the category.')
 
         return cleaned_data
 
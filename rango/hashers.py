@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.contrib.auth.hashers import (Argon2PasswordHasher,
+                                         PBKDF2PasswordHasher)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    Argon2 with its costs read from the RANGO_ARGON2_* settings. Hashes
+    made with other costs are updated the next time their user logs in.
+    """
+
+    @property
+    def time_cost(self):
+        return getattr(settings, 'RANGO_ARGON2_TIME_COST',
+                       Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'RANGO_ARGON2_MEMORY_COST',
+                       Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'RANGO_ARGON2_PARALLELISM',
+                       Argon2PasswordHasher.parallelism)
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 with its number of iterations read from the
+    RANGO_PBKDF2_ITERATIONS setting, used when argon2-cffi isn't installed.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'RANGO_PBKDF2_ITERATIONS',
+                       PBKDF2PasswordHasher.iterations)
@@ -0,0 +1,109 @@
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+from rango.models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+# The resized versions generated for every profile picture:
+# name -> (maximum width and height, format, file extension)
+VARIANTS = {
+    'thumbnail': (64, 'JPEG', 'jpg'),
+    'medium': (256, 'JPEG', 'jpg'),
+    'webp': (256, 'WEBP', 'webp'),
+}
+
+VARIANT_DIRECTORY = 'profile_images/variants'
+
+_executor = None
+_executor_lock = Lock()
+
+
+def variant_name(picture_hash, variant):
+    # Variant files are named after the hash of the original picture, so
+    # a name always refers to the same content and can be cached forever.
+    return f'{VARIANT_DIRECTORY}/{picture_hash}_{variant}.{VARIANTS[variant][2]}'
+
+
+def render_variant(image, variant):
+    size, format, _ = VARIANTS[variant]
+    image = image.copy()
+    image.thumbnail((size, size), Image.LANCZOS)
+    output = BytesIO()
+    image.save(output, format, quality=85, optimize=True)
+    return output.getvalue()
+
+
+def process_picture(profile_id):
+    """
+    Generate the resized variants of a profile's picture and record the
+    picture's hash, which tells the profile_picture tag they are ready.
+    """
+    try:
+        profile = UserProfile.objects.get(pk=profile_id)
+        if not profile.picture:
+            return
+        with profile.picture.open('rb') as f:
+            data = f.read()
+        picture_hash = hashlib.sha256(data).hexdigest()[:32]
+
+        image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+        image = image.convert('RGB')
+        for variant in VARIANTS:
+            name = variant_name(picture_hash, variant)
+            # Identical uploads share their variants
+            if not default_storage.exists(name):
+                default_storage.save(
+                    name, ContentFile(render_variant(image, variant)))
+
+        UserProfile.objects.filter(pk=profile_id) \
+            .update(picture_hash=picture_hash)
+    except Exception:
+        logger.exception('Could not process the picture of profile %s',
+                         profile_id)
+
+
+def process_in_worker(profile_id):
+    try:
+        process_picture(profile_id)
+    finally:
+        # Each worker thread has its own database connection
+        connection.close()
+
+
+def schedule(profile):
+    """
+    Process the profile's picture on the worker pool once the current
+    transaction commits, so the request saving the profile doesn't wait
+    for it. With RANGO_IMAGE_WORKERS = 0 the picture is processed right
+    away instead.
+    """
+    global _executor
+    workers = getattr(settings, 'RANGO_IMAGE_WORKERS', 2)
+    if not workers:
+        transaction.on_commit(lambda: process_picture(profile.pk))
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(workers,
+                                           thread_name_prefix='rango-images')
+    transaction.on_commit(lambda: _executor.submit(process_in_worker,
+                                                   profile.pk))
+
+
+def picture_url(profile, variant):
+    # URL of the given variant of the profile's picture, or of the
+    # original until the variants have been generated
+    if not profile or not profile.picture:
+        return ''
+    if profile.picture_hash and variant in VARIANTS:
+        return default_storage.url(variant_name(profile.picture_hash,
+                                                variant))
+    return profile.picture.url
@@ -0,0 +1,94 @@
+from django.conf import settings
+from rango import caching
+from rango.metrics import filling_cache
+from rango.models import Category, Page
+from rango.routers import primary
+
+
+class Leaderboard:
+    """
+    A precomputed top-N list of model instances ranked by a counter field.
+
+    The list is stored in the Rango cache as plain dictionaries (so the
+    index view needs neither a sorted query nor model instances) and is
+    kept current incrementally: record() merges a saved instance into the
+    list, and only throws the list away when an entry may have dropped
+    below a row we are not tracking.
+    """
+
+    def __init__(self, name, model, field, fields, size=None):
+        self.model = model
+        self.field = field
+        self.fields = ('id', field) + tuple(fields)
+        self.size = size or getattr(settings, 'RANGO_LEADERBOARD_SIZE', 5)
+        self.key = f'{caching.KEY_PREFIX}:leaderboard:{name}'
+
+    def sort_key(self, entry):
+        # Highest score first, ties broken by the oldest row
+        return (-entry[self.field], entry['id'])
+
+    def load(self):
+        # Fall back to the (indexed) sorted query to rebuild the list,
+        # on the primary as the list is cached until the next change.
+        with primary(), filling_cache():
+            entries = list(self.model.objects
+                           .order_by(f'-{self.field}', 'id')
+                           .values(*self.fields)[:self.size])
+        caching.get_cache().set(self.key, entries, timeout=None)
+        return entries
+
+    def get(self):
+        entries = caching.get_cache().get(self.key)
+        if entries is None:
+            entries = self.load()
+        return entries
+
+    def record(self, instance):
+        cache = caching.get_cache()
+        entries = cache.get(self.key)
+        if entries is None:
+            # Nothing cached yet, the next read will load a fresh list.
+            return
+
+        entry = {field: getattr(instance, field) for field in self.fields}
+        others = [e for e in entries if e['id'] != instance.pk]
+        tracked = len(others) != len(entries)
+        # A short list holds every row in the table, so it is complete.
+        complete = len(entries) < self.size
+
+        if not complete and \
+                self.sort_key(entry) > self.sort_key(entries[-1]):
+            if tracked:
+                # The entry fell to the bottom of a full list; a row we are
+                # not tracking may now outrank it, so rebuild on next read.
+                cache.delete(self.key)
+            # Otherwise it is not good enough to make the list.
+            return
+
+        entries = sorted(others + [entry], key=self.sort_key)[:self.size]
+        cache.set(self.key, entries, timeout=None)
+
+    def discard(self, instance):
+        cache = caching.get_cache()
+        entries = cache.get(self.key)
+        if entries is not None and \
+                any(e['id'] == instance.pk for e in entries):
+            # A row left the list; refill it from the database next time.
+            cache.delete(self.key)
+
+    def invalidate(self):
+        caching.get_cache().delete(self.key)
+
+
+top_categories = Leaderboard('top_categories', Category, 'likes',
+                             ('name', 'slug'))
+top_pages = Leaderboard('top_pages', Page, 'views', ('title', 'url'))
+# Ranked by time-decayed activity (see rango.trending)
+trending_categories = Leaderboard('trending_categories', Category, 'trend',
+                                  ('name', 'slug'))
+trending_pages = Leaderboard('trending_pages', Page, 'trend', ('title', 'url'))
+
+# Every leaderboard, so code updating counters without saving instances
+# (see rango.counters) can keep them current
+LEADERBOARDS = [top_categories, top_pages, trending_categories,
+                trending_pages]
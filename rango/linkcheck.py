@@ -0,0 +1,244 @@
+import asyncio
+import html
+import logging
+import re
+import ssl
+import time
+from collections import namedtuple
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from urllib.parse import urljoin, urlsplit
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from rango.models import Page
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'RangoLinkChecker/1.0'
+
+# Only this much of a document is read, looking for its <title>
+MAX_BODY = 64 * 1024
+MAX_REDIRECTS = 5
+
+TITLE = re.compile(rb'<title[^>]*>(.*?)</title', re.IGNORECASE | re.DOTALL)
+CHARSET = re.compile(r'charset=["\']?([\w-]+)', re.IGNORECASE)
+
+# What a check found: status is 0 when the server couldn't be reached
+# (or redirected too many times), and 304 when the page hasn't changed
+# since the last check.
+Result = namedtuple('Result', 'status title etag last_modified')
+UNREACHABLE = Result(0, '', '', '')
+
+
+class HostLimiter:
+    """
+    Limits the requests sent to each host: at most `concurrency` at a
+    time, started at least `delay` seconds apart.
+    """
+
+    def __init__(self, concurrency, delay):
+        self.concurrency = concurrency
+        self.delay = delay
+        self.semaphores = {}
+        self.locks = {}
+        self.last_start = {}
+
+    @asynccontextmanager
+    async def slot(self, host):
+        semaphore = self.semaphores.setdefault(
+            host, asyncio.Semaphore(self.concurrency))
+        async with semaphore:
+            async with self.locks.setdefault(host, asyncio.Lock()):
+                wait = (self.last_start.get(host, float('-inf')) +
+                        self.delay - time.monotonic())
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self.last_start[host] = time.monotonic()
+            yield
+
+
+async def read_body(reader, headers):
+    # Up to MAX_BODY bytes of the response body, undoing chunked encoding
+    if headers.get('transfer-encoding', '').lower() != 'chunked':
+        length = headers.get('content-length')
+        limit = MAX_BODY if length is None else min(int(length), MAX_BODY)
+        try:
+            return await reader.readexactly(limit)
+        except asyncio.IncompleteReadError as e:
+            return e.partial
+    body = b''
+    while len(body) < MAX_BODY:
+        size = int((await reader.readline()).split(b';')[0], 16)
+        if size == 0:
+            break
+        body += await reader.readexactly(size)
+        await reader.readline()
+    return body[:MAX_BODY]
+
+
+def parse_title(body, content_type):
+    match = TITLE.search(body)
+    if not match:
+        return ''
+    charset = CHARSET.search(content_type)
+    encoding = charset.group(1) if charset else 'utf-8'
+    try:
+        title = match.group(1).decode(encoding, 'replace')
+    except LookupError:
+        title = match.group(1).decode('utf-8', 'replace')
+    title = ' '.join(html.unescape(title).split())
+    return title[:Page.TITLE_MAX_LENGTH]
+
+
+async def request(url, headers, timeout):
+    # GET url, returning the status, the response headers (lower-cased
+    # names) and the start of the body
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        # e.g. mailto:, or an address stored without its scheme
+        raise ValueError(f'Not an HTTP URL: {url!r}')
+    secure = parts.scheme == 'https'
+    default_port = 443 if secure else 80
+    port = parts.port or default_port
+    # The host and port only: the URL's netloc may have credentials in it
+    host = f'[{parts.hostname}]' if ':' in parts.hostname else parts.hostname
+    if port != default_port:
+        host = f'{host}:{port}'
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(
+        parts.hostname, port,
+        ssl=ssl.create_default_context() if secure else None), timeout)
+    try:
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        lines = [f'GET {path} HTTP/1.1', f'Host: {host}',
+                 f'User-Agent: {USER_AGENT}', 'Accept: text/html,*/*',
+                 'Accept-Encoding: identity', 'Connection: close']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await writer.drain()
+
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        body = b''
+        if status == 200 and 'html' in response_headers.get(
+                'content-type', ''):
+            body = await asyncio.wait_for(
+                read_body(reader, response_headers), timeout)
+        return status, response_headers, body
+    finally:
+        writer.close()
+
+
+async def check(url, etag='', last_modified='', timeout=10):
+    """
+    Fetch url (following redirects), sending the validators from the
+    previous check so that an unchanged page costs a 304 and no body.
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    try:
+        for _ in range(MAX_REDIRECTS + 1):
+            status, response_headers, body = await request(url, headers,
+                                                           timeout)
+            if status in (301, 302, 303, 307, 308) and \
+                    'location' in response_headers:
+                url = urljoin(url, response_headers['location'])
+                # The validators belong to the original URL
+                headers = {}
+                continue
+            return Result(
+                status,
+                parse_title(body, response_headers.get('content-type', '')),
+                response_headers.get('etag', '')[:128],
+                response_headers.get('last-modified', '')[:64])
+        # Too many redirects
+        return UNREACHABLE
+    except (OSError, ValueError, IndexError, asyncio.TimeoutError,
+            asyncio.IncompleteReadError):
+        return UNREACHABLE
+
+
+async def check_all(pages, concurrency=20, per_host=2, host_delay=0.5,
+                    timeout=10):
+    """
+    Check every (url, etag, last_modified) in pages, with at most
+    `concurrency` requests in flight overall and `per_host` to each host,
+    started `host_delay` seconds apart. Returns the results in order.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    hosts = HostLimiter(per_host, host_delay)
+
+    async def check_one(url, etag, last_modified):
+        # Wait for the host first, so that a busy host doesn't hold up
+        # the requests to the others
+        async with hosts.slot(urlsplit(url).netloc.lower()):
+            async with semaphore:
+                return await check(url, etag, last_modified, timeout)
+
+    # One page failing in a way check() doesn't expect mustn't lose the
+    # results of the others, or stop the batch from being recorded.
+    results = await asyncio.gather(*(check_one(*page) for page in pages),
+                                   return_exceptions=True)
+    for (url, _, _), result in zip(pages, results):
+        if isinstance(result, Exception):
+            logger.error('Checking %s failed: %r', url, result)
+    return [UNREACHABLE if isinstance(result, Exception) else result
+            for result in results]
+
+
+def pages_due(batch_size, interval=None):
+    """
+    The next batch of pages to check: those never checked, then those
+    checked longest ago, leaving out the ones checked in the last
+    `interval` (RANGO_LINK_CHECK_INTERVAL by default).
+    """
+    if interval is None:
+        interval = timedelta(seconds=getattr(
+            settings, 'RANGO_LINK_CHECK_INTERVAL', 7 * 24 * 60 * 60))
+    due = Q(link_checked__isnull=True) | \
+        Q(link_checked__lt=timezone.now() - interval)
+    return list(Page.objects.filter(due)
+                .order_by(F('link_checked').asc(nulls_first=True), 'id')
+                [:batch_size])
+
+
+def check_batch(batch_size=500, interval=None, **options):
+    """
+    Check the next batch of pages and record what was found. Run it on a
+    schedule (see the check_links command) to go through every page a
+    batch at a time. Returns the pages checked.
+    """
+    pages = pages_due(batch_size, interval)
+    if not pages:
+        return []
+    results = asyncio.run(check_all(
+        [(page.url, page.link_etag, page.link_last_modified)
+         for page in pages], **options))
+
+    now = timezone.now()
+    for page, result in zip(pages, results):
+        page.link_checked = now
+        if result.status == 304:
+            # Unchanged since the last check: keep what we found then
+            continue
+        page.link_status = result.status
+        page.link_title = result.title
+        page.link_etag = result.etag
+        page.link_last_modified = result.last_modified
+    Page.objects.bulk_update(pages, ['link_status', 'link_checked',
+                                     'link_title', 'link_etag',
+                                     'link_last_modified'])
+    return pages
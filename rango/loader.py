@@ -0,0 +1,162 @@
+import csv
+import json
+from itertools import islice
+from django.db import connection, transaction
+from django.template.defaultfilters import slugify
+from rango import caching, search
+from rango.leaderboards import LEADERBOARDS
+from rango.models import Category, Page
+from rango.urlnorm import url_hash
+
+
+def read_rows(path, format=None):
+    """
+    Stream rows out of a CSV file (with a header line) or a JSON Lines
+    file (one object per line), without reading the whole file in.
+
+    Each row names a category and, optionally, one of its pages:
+    category, category_views, category_likes, title, url, views.
+    """
+    format = format or ('csv' if path.endswith('.csv') else 'json')
+    with open(path, newline='', encoding='utf-8') as f:
+        if format == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def to_int(value):
+    # CSV gives us strings, and missing columns come back as None or ''
+    return None if value in (None, '') else int(value)
+
+
+def update_pages(pages):
+    # bulk_update() builds a CASE WHEN expression per row, which costs far
+    # more Python time than the update itself; a plain executemany() of
+    # one parameterised UPDATE is several times faster for large batches.
+    table = connection.ops.quote_name(Page._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {table} SET title = %s, views = %s WHERE id = %s',
+            [(page.title, page.views, page.id) for page in pages])
+
+
+def load_batch(rows):
+    # Upsert one batch of rows with a fixed number of queries, however
+    # many rows it holds. Returns the number of rows created and updated,
+    # and the slugs of the categories whose pages changed.
+    created = updated = 0
+
+    # Categories, keyed on their (unique) name. Later rows win.
+    wanted = {}
+    for row in rows:
+        counters = wanted.setdefault(row['category'], {})
+        for field in ('views', 'likes'):
+            value = to_int(row.get(f'category_{field}'))
+            if value is not None:
+                counters[field] = value
+
+    categories = Category.objects.in_bulk(list(wanted), field_name='name')
+    new = [Category(name=name, slug=slugify(name), **counters)
+           for name, counters in wanted.items() if name not in categories]
+    Category.objects.bulk_create(new)
+    created += len(new)
+    changed = []
+    for name, counters in wanted.items():
+        category = categories.get(name)
+        if category and any(getattr(category, field) != value
+                            for field, value in counters.items()):
+            for field, value in counters.items():
+                setattr(category, field, value)
+            changed.append(category)
+    Category.objects.bulk_update(changed, ['views', 'likes'])
+    updated += len(changed)
+    if new:
+        # bulk_create() doesn't give us primary keys on every database,
+        # so look the new categories up again.
+        categories.update(Category.objects.in_bulk(
+            [category.name for category in new], field_name='name'))
+
+    # Pages, keyed on their category and canonical URL (see
+    # rango.urlnorm). Later rows win.
+    wanted = {}
+    for row in rows:
+        if row.get('url'):
+            category = categories[row['category']]
+            wanted[(category.id, url_hash(row['url']))] = {
+                'url': row['url'],
+                'title': row.get('title') or row['url'],
+                'views': to_int(row.get('views')) or 0,
+            }
+
+    # Look pages up by URL alone, which the unique (url_hash, category)
+    # index serves directly, and match their categories here.
+    existing = {(page.category_id, page.url_hash): page
+                for page in Page.objects.filter(
+                    url_hash__in={key for _, key in wanted})}
+    new = []
+    changed = []
+    for (category_id, key), fields in wanted.items():
+        page = existing.get((category_id, key))
+        if page is None:
+            new.append(Page(category_id=category_id, url_hash=key, **fields))
+        elif page.title != fields['title'] or page.views != fields['views']:
+            page.title = fields['title']
+            page.views = fields['views']
+            changed.append(page)
+    Page.objects.bulk_create(new)
+    update_pages(changed)
+    created += len(new)
+    updated += len(changed)
+
+    slugs = {category.id: category.slug for category in categories.values()}
+    touched = {slugs[page.category_id] for page in new + changed}
+    return created, updated, touched
+
+
+def load(rows, batch_size=1000):
+    """
+    Upsert the given rows into the database in batches, each in its own
+    transaction, so loading the same file twice changes nothing.
+    Returns the number of rows read, created and updated.
+    """
+    total = created = updated = 0
+    touched = set()
+    for batch in batches(rows, batch_size):
+        with transaction.atomic():
+            batch_created, batch_updated, batch_touched = load_batch(batch)
+        total += len(batch)
+        created += batch_created
+        updated += batch_updated
+        touched |= batch_touched
+
+    if created or updated:
+        invalidate_caches(touched)
+
+    return {'rows': total, 'created': created, 'updated': updated}
+
+
+def invalidate_caches(slugs=()):
+    # Bulk operations don't send model signals, so drop the caches that
+    # depend on categories and pages ourselves, including the page lists
+    # of the categories with the given slugs.
+    caching.invalidate_category_list()
+    for slug in slugs:
+        caching.invalidate_category(slug)
+    caching.category_lookup.clear()
+    for leaderboard in LEADERBOARDS:
+        leaderboard.invalidate()
+    # Reindexing everything in a few statements is far cheaper than
+    # indexing the rows one by one as we change them.
+    search.rebuild()
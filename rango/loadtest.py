@@ -0,0 +1,163 @@
+import http.client
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.test.testcases import LiveServerThread
+from django.urls import reverse
+from rango import urls
+from rango.models import Category, Page
+
+USERNAME = 'loadtest'
+PASSWORD = 'loadtest-password'
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+class SimulatedClient:
+    """
+    A visitor to the live server: keeps its cookies (and so its session)
+    across requests, doesn't follow redirects, and records how long each
+    request took and how many queries it cost the server.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.cookies = SimpleCookie()
+
+    def request(self, method, path, data=None):
+        headers = {'Cookie': '; '.join(f'{key}={morsel.value}'
+                                       for key, morsel in self.cookies.items())}
+        body = None
+        if method == 'POST':
+            data = dict(data or {})
+            if 'csrftoken' in self.cookies:
+                data['csrfmiddlewaretoken'] = self.cookies['csrftoken'].value
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        connection = http.client.HTTPConnection(self.host, self.port)
+        try:
+            start = time.perf_counter()
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            response.read()
+            elapsed = time.perf_counter() - start
+        finally:
+            connection.close()
+
+        for header in response.headers.get_all('Set-Cookie') or ():
+            self.cookies.load(header)
+        match = SERVER_TIMING_QUERIES.search(
+            response.headers.get('Server-Timing', ''))
+        return response.status, elapsed, int(match.group(1)) if match else None
+
+    def login(self):
+        self.request('GET', reverse('rango:login'))
+        self.request('POST', reverse('rango:login'),
+                     {'username': USERNAME, 'password': PASSWORD})
+
+
+def scenarios():
+    """
+    One scenario per URL pattern in rango/urls.py: (name, method, path,
+    data, setup), where setup (if any) runs untimed before each request.
+    Views that would create data are only driven with GET.
+    """
+    category = Category.objects.order_by('id').first()
+    page = Page.objects.order_by('id').first()
+    special = {
+        'goto': {'data': {'page_id': page.id}},
+        'search': {'data': {'q': 'topic42'}},
+        'api_search': {'data': {'q': 'topic42'}},
+        'login': {'method': 'POST',
+                  'data': {'username': USERNAME, 'password': PASSWORD},
+                  'setup': lambda client: client.request(
+                      'GET', reverse('rango:login'))},
+        'logout': {'setup': SimulatedClient.login},
+    }
+    for pattern in urls.urlpatterns:
+        kwargs = {}
+        if 'category_name_slug' in pattern.pattern.converters:
+            kwargs['category_name_slug'] = category.slug
+        options = special.get(pattern.name, {})
+        yield (pattern.name, options.get('method', 'GET'),
+               reverse(f'{urls.app_name}:{pattern.name}', kwargs=kwargs),
+               options.get('data'), options.get('setup'))
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of a sorted list
+    return values[max(0, int(round(fraction * len(values))) - 1)]
+
+
+def drive(host, port, method, path, data, setup, requests, concurrency):
+    # Send the requests from `concurrency` clients at once, each logged in
+    # beforehand (so login_required views are measured rather than their
+    # redirect). Setup steps are left out of the latencies, but not out of
+    # the throughput.
+    clients = [SimulatedClient(host, port) for _ in range(concurrency)]
+    for client in clients:
+        client.login()
+    query = f'?{urlencode(data)}' if data and method == 'GET' else ''
+
+    def worker(client, count):
+        results = []
+        for _ in range(count):
+            if setup:
+                setup(client)
+            results.append(client.request(method, path + query, data))
+        return results
+
+    counts = [requests // concurrency + (i < requests % concurrency)
+              for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = [result
+                   for worker_results in executor.map(worker, clients, counts)
+                   for result in worker_results]
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency * 1000 for _, latency, _ in results)
+    queries = [count for _, _, count in results if count is not None]
+    return {
+        'requests': len(results),
+        'errors': sum(1 for status, _, _ in results if status >= 500),
+        'throughput_rps': round(len(results) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'queries_per_request': round(sum(queries) / len(queries), 2)
+        if queries else None,
+    }
+
+
+def run(requests=200, concurrency=8, only=None):
+    """
+    Start a live server on the current (test) database and drive every
+    URL in rango/urls.py, returning the measurements per URL name.
+    """
+    User.objects.create_user(USERNAME, password=PASSWORD)
+    server = LiveServerThread('localhost', lambda handler: handler)
+    server.daemon = True
+    server.start()
+    server.is_ready.wait()
+    if server.error:
+        raise server.error
+    try:
+        # Every client logs in from the same address, which the login
+        # rate limits would soon refuse.
+        with override_settings(RANGO_LOGIN_RATE_LIMITS={}):
+            return {
+                name: drive('localhost', server.port, method, path, data,
+                            setup, requests, concurrency)
+                for name, method, path, data, setup in scenarios()
+                if not only or name in only
+            }
+    finally:
+        server.terminate()
+        server.join()
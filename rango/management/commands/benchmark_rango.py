@@ -0,0 +1,37 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from rango.benchmarks import BENCHMARKS, seed, throwaway_database
+
+
+class Command(BaseCommand):
+    help = ('Runs the Rango benchmarks against a throwaway test database '
+            'seeded with synthetic data, and prints the results as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmarks', nargs='*',
+                            help='Benchmarks to run (default: all). '
+                                 f'Available: {", ".join(sorted(BENCHMARKS))}')
+        parser.add_argument('--categories', type=int, default=20,
+                            help='Number of categories to seed.')
+        parser.add_argument('--pages', type=int, default=50,
+                            help='Number of pages to seed per category.')
+        parser.add_argument('--requests', type=int, default=10,
+                            help='Number of requests per measurement.')
+        parser.add_argument('--events', type=int, default=100000,
+                            help='Number of events to roll up in the '
+                                 'trending benchmark.')
+
+    def handle(self, *args, **options):
+        names = options['benchmarks'] or sorted(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f'Unknown benchmark(s): {", ".join(unknown)}')
+
+        # Never touch the real database: run against a test database that
+        # is created for this run and destroyed afterwards.
+        with throwaway_database(on_disk=any(BENCHMARKS[name].on_disk
+                                            for name in names)):
+            seed(options['categories'], options['pages'])
+            report = {name: BENCHMARKS[name](**options) for name in names}
+
+        self.stdout.write(json.dumps(report, indent=4))
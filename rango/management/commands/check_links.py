@@ -0,0 +1,47 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rango.linkcheck import check_batch
+
+
+class Command(BaseCommand):
+    help = ('Checks the URLs of the pages due for a check (never checked, '
+            'or not for RANGO_LINK_CHECK_INTERVAL seconds), a batch at a '
+            'time, recording their status and title. Meant to be run on a '
+            'schedule, e.g. from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of pages per batch.')
+        parser.add_argument('--batches', type=int, default=1,
+                            help='Number of batches to check (0 for as many '
+                                 'as there are pages due).')
+        parser.add_argument('--concurrency', type=int, default=20,
+                            help='Requests in flight at once.')
+        parser.add_argument('--per-host', type=int, default=2,
+                            help='Requests in flight at once to one host.')
+        parser.add_argument('--host-delay', type=float, default=0.5,
+                            help='Seconds between the requests to one host.')
+        parser.add_argument('--timeout', type=float, default=10,
+                            help='Seconds to wait for each response.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['concurrency'] < 1 or \
+                options['per_host'] < 1:
+            raise CommandError('--batch-size, --concurrency and --per-host '
+                               'must be at least 1.')
+
+        batch = 0
+        while not options['batches'] or batch < options['batches']:
+            start = time.perf_counter()
+            pages = check_batch(
+                options['batch_size'], concurrency=options['concurrency'],
+                per_host=options['per_host'],
+                host_delay=options['host_delay'],
+                timeout=options['timeout'])
+            if not pages:
+                break
+            batch += 1
+            dead = sum(1 for page in pages if page.link_dead)
+            self.stdout.write(
+                f'Checked {len(pages)} pages in '
+                f'{time.perf_counter() - start:.1f}s: {dead} dead')
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rango.sessions import SessionStore
+
+
+class Command(BaseCommand):
+    help = ('Deletes the expired sessions from the database in small '
+            'batches, so the table is never locked for long. Run it on a '
+            'schedule.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of sessions per transaction.')
+        parser.add_argument('--pause', type=float, default=0.1,
+                            help='Seconds to sleep between batches.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        start = time.perf_counter()
+        deleted = SessionStore.clear_expired(options['batch_size'],
+                                             options['pause'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'Deleted {deleted} expired sessions in {elapsed:.2f}s')
@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rango.dedup import merge_duplicates
+
+
+class Command(BaseCommand):
+    help = ('Gives the pages saved before URLs were normalized their '
+            'canonical URL, merging the pages of a category that share one '
+            'and summing their views.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of pages per transaction.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        start = time.perf_counter()
+        stats = merge_duplicates(options['batch_size'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'Examined {stats["pages"]} pages and merged {stats["merged"]} '
+            f'duplicates in {elapsed:.2f}s')
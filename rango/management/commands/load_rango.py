@@ -0,0 +1,51 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rango.loader import load, read_rows
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; we fall back to tracemalloc there.
+    resource = None
+    import tracemalloc
+
+
+def peak_memory():
+    # Peak memory use of this process so far, in MiB
+    if resource is not None:
+        # ru_maxrss is in KiB on Linux (and in bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+    return tracemalloc.get_traced_memory()[1] / 2 ** 20
+
+
+class Command(BaseCommand):
+    help = ('Loads categories and pages from a CSV or JSON Lines file, '
+            'creating or updating them in batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to load.')
+        parser.add_argument('--format', choices=('csv', 'json'),
+                            help='File format (default: guessed from the '
+                                 'file extension).')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows per transaction.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        if resource is None:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            stats = load(read_rows(options['path'], options['format']),
+                         options['batch_size'])
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f'Could not load {options["path"]}: {e!r}')
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f'Loaded {stats["rows"]} rows ({stats["created"]} created, '
+            f'{stats["updated"]} updated) in {elapsed:.2f}s: '
+            f'{stats["rows"] / elapsed:.0f} rows/s, '
+            f'peak memory {peak_memory():.1f} MiB')
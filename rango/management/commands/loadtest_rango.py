@@ -0,0 +1,74 @@
+import json
+import platform
+import subprocess
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rango import caching, loadtest, search
+from rango.benchmarks import seed, throwaway_database
+from rango.counters import counters
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.DEVNULL,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Load-tests every Rango URL with concurrent clients against a '
+            'live server on a throwaway database, at one or more data '
+            'scales, and reports throughput, latency percentiles and '
+            'queries per request as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', action='append', dest='scales',
+                            help='CATEGORIESxPAGES_PER_CATEGORY to seed; may '
+                                 'be repeated (default: 10x10, 100x100 and '
+                                 '100x1000).')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per URL.')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Number of simultaneous clients.')
+        parser.add_argument('--only', action='append',
+                            help='Only drive this URL name; may be repeated.')
+        parser.add_argument('--output', help='Also write the report here.')
+
+    def handle(self, *args, **options):
+        scales = options['scales'] or ['10x10', '100x100', '100x1000']
+        try:
+            scales = [tuple(int(n) for n in scale.split('x'))
+                      for scale in scales]
+        except ValueError:
+            raise CommandError('Scales look like 100x1000.')
+
+        report = {
+            'commit': current_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'scales': {},
+        }
+        for categories, pages in scales:
+            # The live server runs in other threads, so the database has to
+            # be a file they can each connect to.
+            with throwaway_database(on_disk=True), \
+                    override_settings(ALLOWED_HOSTS=['localhost']):
+                seed(categories, pages)
+                # seed() bypasses the signals maintaining these
+                search.rebuild()
+                caching.get_cache().clear()
+                report['scales'][f'{categories}x{pages}'] = loadtest.run(
+                    options['requests'], options['concurrency'],
+                    options['only'])
+                counters.flush()
+
+        output = json.dumps(report, indent=4, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rango import trending
+
+
+class Command(BaseCommand):
+    help = ('Rolls the page views and likes logged since the last run up '
+            'into hourly counts and time-decayed trending scores.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100000,
+                            help='Number of events per transaction.')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute every score from the hourly '
+                                 'counts afterwards, e.g. after changing '
+                                 'RANGO_TRENDING_HALF_LIFE.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        start = time.perf_counter()
+        events = trending.roll_up(options['batch_size'])
+        if options['rebuild']:
+            trending.rebuild()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'Rolled up {events} events in {elapsed:.2f}s')
@@ -0,0 +1,35 @@
+import sqlite3
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ('Copies the (SQLite) primary database over the SQLite '
+            'replicas in RANGO_REPLICAS, to try out replica routing '
+            'locally.')
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Only SQLite replicas can be synced; real '
+                               'replicas are kept up to date by the '
+                               'database server.')
+        replicas = getattr(settings, 'RANGO_REPLICAS', [])
+        if not replicas:
+            raise CommandError('No replicas are configured '
+                               '(see RANGO_SQLITE_REPLICAS).')
+
+        primary.ensure_connection()
+        for alias in replicas:
+            replica = connections[alias]
+            replica.close()
+            # The backup API copies a consistent snapshot, even while the
+            # primary is being written to.
+            target = sqlite3.connect(replica.settings_dict['NAME'])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(f'Copied {primary.settings_dict["NAME"]} to '
+                              f'{replica.settings_dict["NAME"]}')
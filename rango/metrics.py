@@ -0,0 +1,177 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template.exceptions import TemplateDoesNotExist
+
+logger = logging.getLogger(__name__)
+
+# Measurements for the request being handled by the current thread
+_current = threading.local()
+
+# Totals per view since the process started, served by the metrics view
+_lock = threading.Lock()
+_totals = defaultdict(lambda: defaultdict(float))
+
+
+# Statements managing transactions rather than reading or writing data
+# (transaction.atomic() starts a transaction with BEGIN, or inside one, as
+# in the tests, makes a savepoint)
+TRANSACTION_CONTROL = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT',
+                       'RELEASE SAVEPOINT')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def current():
+    return getattr(_current, 'metrics', None)
+
+
+@contextmanager
+def filling_cache():
+    """
+    Don't count the queries run in the enclosed code against the request's
+    query budget: they rebuild a cached value, which the requests after it
+    are served from, so they aren't part of the steady state the budgets
+    are for.
+    """
+    previous = getattr(_current, 'filling_cache', False)
+    _current.filling_cache = True
+    try:
+        yield
+    finally:
+        _current.filling_cache = previous
+
+
+class TimedTemplate(Template):
+    # Adds the time spent rendering to the current request's metrics.
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics = current()
+            if metrics is not None:
+                metrics['template_ms'] += (time.perf_counter() - start) * 1000
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing every template it renders. Only
+    top-level templates are timed: those they include or extend render
+    as part of them.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name),
+                                 self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def record_query(execute, sql, params, many, context):
+    # Database execute wrapper counting and timing every query
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics = current()
+        if metrics is not None:
+            metrics['sql_ms'] += (time.perf_counter() - start) * 1000
+            if not sql.startswith(TRANSACTION_CONTROL):
+                metrics['queries'] += 1
+                if getattr(_current, 'filling_cache', False):
+                    metrics['cache_queries'] += 1
+
+
+class MetricsMiddleware:
+    """
+    Measures each request: number of SQL queries, time spent in SQL and
+    in rendering templates, and total time. The measurements are sent
+    back in a Server-Timing header (shown by browser developer tools),
+    attached to the response as response.metrics (used by the query
+    budget tests), and added to per-view totals for the metrics view.
+
+    A view running more queries than its budget (not counting those
+    filling caches) raises QueryBudgetExceeded when
+    RANGO_QUERY_BUDGET_ERRORS is set, as the budget tests do, and logs a
+    warning otherwise.
+
+    Unlike DEBUG's query log, this works with DEBUG = False and keeps no
+    SQL around.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = _current.metrics = defaultdict(float)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(record_query))
+                response = self.get_response(request)
+        finally:
+            _current.metrics = None
+        metrics['total_ms'] = (time.perf_counter() - start) * 1000
+        metrics['queries'] = int(metrics['queries'])
+        metrics['cache_queries'] = int(metrics['cache_queries'])
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={metrics["sql_ms"]:.2f};desc="{metrics["queries"]} queries"',
+            f'tpl;dur={metrics["template_ms"]:.2f}',
+            f'total;dur={metrics["total_ms"]:.2f}',
+        ])
+        response.metrics = metrics
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        with _lock:
+            totals = _totals[view]
+            totals['requests'] += 1
+            for name, value in metrics.items():
+                totals[name] += value
+                totals[f'max_{name}'] = max(totals[f'max_{name}'], value)
+
+        budget = get_budget(view)
+        queries = metrics['queries'] - metrics['cache_queries']
+        if budget is not None and queries > budget:
+            message = f'{view} ran {queries} queries, over its budget of ' \
+                      f'{budget}'
+            if getattr(settings, 'RANGO_QUERY_BUDGET_ERRORS', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+def get_totals():
+    # Per-view number of requests, and the average and maximum of every
+    # measurement
+    results = {}
+    with _lock:
+        for view, totals in _totals.items():
+            requests = totals['requests']
+            results[view] = {'requests': int(requests)}
+            for name, value in totals.items():
+                if name.startswith('max_'):
+                    results[view][name] = value
+                elif name != 'requests':
+                    results[view][f'avg_{name}'] = value / requests
+    return results
+
+
+def get_budget(view_name):
+    # Maximum number of queries the view may run, or None
+    return getattr(settings, 'RANGO_QUERY_BUDGETS', {}).get(view_name)
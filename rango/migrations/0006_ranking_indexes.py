@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0005_userprofile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='category',
+            name='likes',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='page',
+            name='views',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+    ]
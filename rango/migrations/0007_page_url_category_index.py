@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0006_ranking_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['url', 'category'], name='rango_page_url_f15bf9_idx'),
+        ),
+    ]
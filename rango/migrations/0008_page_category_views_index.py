@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0007_page_url_category_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['category', 'views'], name='rango_page_categor_e2c416_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+
+def create_search_index(apps, schema_editor):
+    # The full-text index is an SQLite FTS5 virtual table. Other
+    # databases, or SQLite builds without FTS5, fall back to the
+    # in-memory index in rango.search.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS rango_search '
+            "USING fts5(title, url, prefix='2 3')")
+    except OperationalError:
+        return
+    schema_editor.execute(
+        'INSERT INTO rango_search (rowid, title, url) '
+        "SELECT id * 2, name, '' FROM rango_category")
+    schema_editor.execute(
+        'INSERT INTO rango_search (rowid, title, url) '
+        'SELECT id * 2 + 1, title, url FROM rango_page')
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS rango_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0008_page_category_views_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0010_userprofile_picture_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='link_checked',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='link_etag',
+            field=models.CharField(blank=True, editable=False, max_length=128),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='link_last_modified',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='link_status',
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='link_title',
+            field=models.CharField(blank=True, editable=False, max_length=128),
+        ),
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['link_checked'], name='rango_page_link_ch_b150e8_idx'),
+        ),
+    ]
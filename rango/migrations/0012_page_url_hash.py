@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0011_page_link_metadata'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='page',
+            name='rango_page_url_f15bf9_idx',
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='url_hash',
+            field=models.CharField(editable=False, max_length=32, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='page',
+            constraint=models.UniqueConstraint(fields=('url_hash', 'category'), name='rango_page_unique_url'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:04
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0012_page_url_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Event',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'page view'), (2, 'category like')])),
+                ('object_id', models.PositiveIntegerField()),
+                ('count', models.IntegerField(default=1)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HourlyCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'page view'), (2, 'category like')])),
+                ('object_id', models.PositiveIntegerField()),
+                ('hour', models.DateTimeField()),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Rollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32, unique=True)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='trend',
+            field=models.FloatField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='trend',
+            field=models.FloatField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddConstraint(
+            model_name='hourlycount',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id', 'hour'), name='rango_hourlycount_unique'),
+        ),
+    ]
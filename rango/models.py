@@ -1,14 +1,20 @@
 from django.db import models
+from django.utils import timezone
 from django.template.defaultfilters import slugify
 from django.contrib.auth.models import User
+from rango.urlnorm import url_hash
 
 class Category(models.Model):
     NAME_MAX_LENGTH = 128
 
     name = models.CharField(max_length=NAME_MAX_LENGTH, unique=True)
     views = models.IntegerField(default=0)
-    likes = models.IntegerField(default=0)
+    # Indexed, as the index view ranks categories by likes
+    likes = models.IntegerField(default=0, db_index=True)
     slug = models.SlugField(unique=True)
+    # Time-decayed activity score, on a log scale (see rango.trending);
+    # 0 means no activity. Indexed, as the index view ranks by it.
+    trend = models.FloatField(default=0, db_index=True, editable=False)
 
     def save(self, *args, **kwargs):
         self.slug = slugify(self.name)
@@ -27,7 +33,50 @@ class Page(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     title = models.CharField(max_length=TITLE_MAX_LENGTH)
     url = models.URLField()
-    views = models.IntegerField(default=0)
+    # Key of the URL's canonical form (see rango.urlnorm), set on save.
+    # A URL can only be added once to a category. Pages saved before this
+    # column existed have none until the dedup_pages command has run.
+    url_hash = models.CharField(max_length=32, null=True, editable=False)
+    # Indexed, as the index view ranks pages by views
+    views = models.IntegerField(default=0, db_index=True)
+    # Time-decayed views, on a log scale (see rango.trending)
+    trend = models.FloatField(default=0, db_index=True, editable=False)
+
+    # What the link checker (see rango.linkcheck) last found at the URL:
+    # the HTTP status (0 if the server couldn't be reached, null if never
+    # checked), when, the document's title, and the validators it sent
+    # for conditional requests next time.
+    link_status = models.PositiveSmallIntegerField(null=True, editable=False)
+    link_checked = models.DateTimeField(null=True, editable=False)
+    link_title = models.CharField(max_length=TITLE_MAX_LENGTH, blank=True,
+                                  editable=False)
+    link_etag = models.CharField(max_length=128, blank=True, editable=False)
+    link_last_modified = models.CharField(max_length=64, blank=True,
+                                          editable=False)
+
+    class Meta:
+        constraints = [
+            # Also serves looking pages up by URL, as when loading them in
+            # bulk (see rango.loader)
+            models.UniqueConstraint(fields=['url_hash', 'category'],
+                                    name='rango_page_unique_url'),
+        ]
+        indexes = [
+            # Categories list their pages by views (see rango.pagination)
+            models.Index(fields=['category', 'views']),
+            # The link checker picks the pages checked longest ago
+            models.Index(fields=['link_checked']),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.url_hash = url_hash(self.url)
+        super(Page, self).save(*args, **kwargs)
+
+    @property
+    def link_dead(self):
+        # Whether the last check found the link broken
+        return (self.link_status is not None and
+                not 200 <= self.link_status < 400)
 
     def __str__(self):
         return self.title
@@ -40,6 +89,57 @@ class UserProfile(models.Model):
     # The additional attributes we wish to include.
     website = models.URLField(blank=True)
     picture = models.ImageField(upload_to='profile_images', blank=True)
+    # Content hash of the picture, set once its resized variants have
+    # been generated (see rango.images); empty until then.
+    picture_hash = models.CharField(max_length=64, blank=True, editable=False)
 
     def __str__(self):
         return self.user.username
+
+
+class Like(models.Model):
+    # A user liking a category; Category.likes counts these rows (see
+    # rango.api.like). A user can like a category only once.
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category'],
+                                    name='rango_like_unique'),
+        ]
+
+
+class Event(models.Model):
+    """
+    Append-only log of activity, rolled up into hourly counts and trend
+    scores by rango.trending. Each row counts the events of one kind on
+    one object since the last flush of the counters, rather than one hit.
+    """
+    PAGE_VIEW = 1
+    CATEGORY_LIKE = 2
+    KINDS = ((PAGE_VIEW, 'page view'), (CATEGORY_LIKE, 'category like'))
+
+    kind = models.PositiveSmallIntegerField(choices=KINDS)
+    object_id = models.PositiveIntegerField()
+    count = models.IntegerField(default=1)
+    created = models.DateTimeField(default=timezone.now)
+
+class HourlyCount(models.Model):
+    # Events of each kind on each object, per hour
+    kind = models.PositiveSmallIntegerField(choices=Event.KINDS)
+    object_id = models.PositiveIntegerField()
+    hour = models.DateTimeField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id', 'hour'],
+                                    name='rango_hourlycount_unique'),
+        ]
+
+class Rollup(models.Model):
+    # How far through the event log the rollup has got
+    name = models.CharField(max_length=32, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
@@ -0,0 +1,132 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+# The orders in which the pages of a category can be listed. Both end on
+# the primary key, so every page has a unique position we can resume from.
+ORDERS = {
+    'views': ('-views', '-id'),
+    'id': ('id',),
+}
+
+
+def encode_cursor(page, order):
+    # The cursor is the position of the last page shown, e.g. '42_1337'
+    # (views, id) when ordering by views.
+    if order == 'views':
+        return f'{page.views}_{page.id}'
+    return str(page.id)
+
+
+def decode_cursor(cursor, order):
+    # Returns a filter selecting the pages after the cursor, or None if
+    # there is no (valid) cursor, in which case we start from the top.
+    try:
+        if order == 'views':
+            views, id = (int(part) for part in cursor.split('_'))
+            # The leading views__lte lets the database seek straight to
+            # the cursor with the (category, views) index.
+            return Q(views__lte=views) & (Q(views__lt=views) | Q(id__lt=id))
+        return Q(id__gt=int(cursor))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class KeysetPage:
+    """
+    One page of a queryset (at most size items, in the given order)
+    starting after a cursor, along with the cursor for the next page
+    (None on the last page).
+
+    Unlike OFFSET pagination, seeking to the cursor is an index lookup,
+    so deep pages cost no more than the first one. The query only runs
+    when items or next_cursor is first used, so a page rendered inside a
+    cached template fragment costs nothing on a cache hit.
+    """
+
+    def __init__(self, queryset, order, after, size):
+        self.queryset = queryset
+        self.order = order
+        self.after = after
+        self.size = size
+
+    @cached_property
+    def result(self):
+        queryset = self.queryset.order_by(*ORDERS[self.order])
+        condition = decode_cursor(self.after, self.order)
+        if condition is not None:
+            queryset = queryset.filter(condition)
+
+        # Fetch one extra item to find out if there is a next page.
+        items = list(queryset[:self.size + 1])
+        if len(items) > self.size:
+            return (items[:self.size],
+                    encode_cursor(items[self.size - 1], self.order))
+        return items, None
+
+    @property
+    def items(self):
+        return self.result[0]
+
+    @property
+    def next_cursor(self):
+        return self.result[1]
+
+
+def estimated_count(queryset):
+    """
+    Roughly how many rows the queryset's table holds, without counting
+    them: from the planner's statistics on PostgreSQL, ANALYZE's on
+    SQLite, and failing those the highest primary key (which overcounts
+    by the rows deleted).
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        try:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples FROM pg_class '
+                               'WHERE oid = %s::regclass', [table])
+            elif connection.vendor == 'sqlite':
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s',
+                               [table])
+            row = cursor.fetchone()
+        except DatabaseError:
+            # No statistics gathered yet
+            row = None
+    # sqlite_stat1's stat starts with the number of rows
+    estimate = int(float(str(row[0]).split()[0])) if row else 0
+    if estimate > 0:
+        return estimate
+    return model._default_manager.using(queryset.db) \
+        .aggregate(highest=Max('pk'))['highest'] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for admin change lists of tables too big to COUNT(*) on
+    every page view. Below RANGO_ADMIN_COUNT_LIMIT rows it counts as
+    usual. Above it, the whole table's count is estimated_count(), and a
+    filtered list stops counting at the limit. count_prefix ('about ',
+    'over ' or '') says which it is.
+    """
+
+    count_prefix = ''
+
+    @cached_property
+    def count(self):
+        limit = getattr(settings, 'RANGO_ADMIN_COUNT_LIMIT', 10000)
+        if not self.object_list.query.where:
+            estimate = estimated_count(self.object_list)
+            if estimate > limit:
+                self.count_prefix = 'about '
+                return estimate
+        # COUNT(*) over a subquery with LIMIT: it stops at the limit.
+        count = self.object_list[:limit + 1].count()
+        if count > limit:
+            self.count_prefix = 'over '
+            return limit
+        return count
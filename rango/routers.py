@@ -0,0 +1,149 @@
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Whether the request being handled by the current thread may read from
+# the replicas. Anything outside a request (management commands, the
+# counter and image threads) reads from the primary.
+_current = threading.local()
+
+# Replication lag per replica alias, as (measured at, seconds)
+_lag = {}
+
+# Name of the cookie keeping a client on the primary after it writes
+PIN_COOKIE = 'rango_primary'
+
+
+def reading_from_replicas():
+    return getattr(_current, 'replicas', False)
+
+
+@contextmanager
+def primary():
+    """
+    Read from the primary in the enclosed code, even during a safe
+    request. For queries whose results are cached: a lagging replica
+    could otherwise return the rows from before the write that just
+    invalidated the cache, and they would be cached under the new
+    version, outliving the write.
+    """
+    previous = reading_from_replicas()
+    _current.replicas = False
+    try:
+        yield
+    finally:
+        _current.replicas = previous
+
+
+def modified(path):
+    # Last time an SQLite database was written to, including to its
+    # write-ahead log
+    times = [os.path.getmtime(path)]
+    if os.path.exists(path + '-wal'):
+        times.append(os.path.getmtime(path + '-wal'))
+    return max(times)
+
+
+def replica_lag(alias):
+    """
+    Seconds the replica is behind the primary, measured at most every
+    RANGO_REPLICA_LAG_INTERVAL seconds.
+
+    For SQLite copies (see the sync_replicas command) this is how much
+    older the copy's file is than the primary's; for PostgreSQL, the age
+    of the last transaction replayed on the replica. Other databases
+    report no lag.
+    """
+    now = time.monotonic()
+    measured = _lag.get(alias)
+    if measured and now - measured[0] < getattr(
+            settings, 'RANGO_REPLICA_LAG_INTERVAL', 5):
+        return measured[1]
+
+    connection = connections[alias]
+    lag = 0.0
+    if connection.vendor == 'sqlite':
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+        try:
+            lag = max(0.0, modified(primary) -
+                      modified(connection.settings_dict['NAME']))
+        except OSError:
+            lag = float('inf')
+    elif connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT EXTRACT(EPOCH FROM now() - '
+                           'pg_last_xact_replay_timestamp())')
+            lag = float(cursor.fetchone()[0] or 0)
+    _lag[alias] = (now, lag)
+    return lag
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of Rango's models to the RANGO_REPLICAS databases
+    during safe (GET and HEAD) requests, unless the client wrote something
+    in the last RANGO_REPLICA_PIN_SECONDS (see ReplicaMiddleware). Writes,
+    and the reads of other applications (sessions, users), always go to
+    the primary.
+
+    RANGO_REPLICA_SELECTION picks the replica: 'round_robin', or
+    'least_lag' for the one furthest ahead. Replicas more than
+    RANGO_REPLICA_MAX_LAG seconds behind are left out either way.
+    """
+
+    def __init__(self):
+        self.counter = itertools.count()
+
+    def db_for_read(self, model, **hints):
+        if (not reading_from_replicas() or
+                model._meta.app_label != 'rango'):
+            return None
+        max_lag = getattr(settings, 'RANGO_REPLICA_MAX_LAG', 30)
+        replicas = [alias for alias in getattr(settings, 'RANGO_REPLICAS', [])
+                    if replica_lag(alias) <= max_lag]
+        if not replicas:
+            return None
+        if getattr(settings, 'RANGO_REPLICA_SELECTION',
+                   'round_robin') == 'least_lag':
+            return min(replicas, key=replica_lag)
+        return replicas[next(self.counter) % len(replicas)]
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get their schema from the primary
+        return db not in getattr(settings, 'RANGO_REPLICAS', [])
+
+
+class ReplicaMiddleware:
+    """
+    Lets ReplicaRouter read from the replicas during safe requests, and
+    keeps a client that has just written on the primary (with a cookie
+    lasting RANGO_REPLICA_PIN_SECONDS) so that it sees its own changes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _current.replicas = (request.method in ('GET', 'HEAD') and
+                             PIN_COOKIE not in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.replicas = False
+
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            response.set_cookie(
+                PIN_COOKIE, '1', httponly=True,
+                max_age=getattr(settings, 'RANGO_REPLICA_PIN_SECONDS', 10))
+        return response
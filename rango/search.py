@@ -0,0 +1,272 @@
+import math
+import re
+from bisect import bisect_left, insort
+from collections import defaultdict
+from threading import Lock
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.urls import reverse
+from rango.models import Category, Page
+
+# The SQLite FTS5 table holding the index. Each category and page is one
+# row, whose rowid encodes both the kind of object and its primary key.
+FTS_TABLE = 'rango_search'
+
+CATEGORY = 'category'
+PAGE = 'page'
+KINDS = (CATEGORY, PAGE)
+
+
+def encode_rowid(kind, pk):
+    return pk * 2 + KINDS.index(kind)
+
+
+def decode_rowid(rowid):
+    return KINDS[rowid % 2], rowid // 2
+
+
+def tokenize(text):
+    # Close to FTS5's default unicode61 tokenizer: lowercase runs of
+    # letters and digits.
+    return re.findall(r'[^\W_]+', text.lower())
+
+
+def documents():
+    # Every category and page as (kind, pk, title, url)
+    for pk, name in Category.objects.values_list('id', 'name').iterator():
+        yield CATEGORY, pk, name, ''
+    for pk, title, url in Page.objects.values_list('id', 'title', 'url') \
+            .iterator(chunk_size=2000):
+        yield PAGE, pk, title, url
+
+
+class FTS5Index:
+    """
+    Search index stored in an SQLite FTS5 virtual table (created by a
+    migration), ranked with FTS5's built-in bm25() function.
+    """
+
+    # Whether the table exists, per database file
+    _available = {}
+
+    @classmethod
+    def available(cls):
+        if connection.vendor != 'sqlite':
+            return False
+        name = connection.settings_dict['NAME']
+        if name not in cls._available:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT 1 FROM {FTS_TABLE} LIMIT 0')
+                cls._available[name] = True
+            except OperationalError:
+                cls._available[name] = False
+        return cls._available[name]
+
+    def add(self, kind, pk, title, url):
+        rowid = encode_rowid(kind, pk)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                           [rowid])
+            cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, title, url) '
+                           'VALUES (%s, %s, %s)', [rowid, title, url])
+
+    def remove(self, kind, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                           [encode_rowid(kind, pk)])
+
+    def rebuild(self):
+        categories = connection.ops.quote_name(Category._meta.db_table)
+        pages = connection.ops.quote_name(Page._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, title, url) '
+                           f"SELECT id * 2, name, '' FROM {categories}")
+            cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, title, url) '
+                           f'SELECT id * 2 + 1, title, url FROM {pages}')
+
+    def query(self, tokens, limit):
+        # Every token must match, as a prefix, in the title or the URL.
+        # Matches in the title weigh ten times as much.
+        match = ' AND '.join('"{}"*'.format(token) for token in tokens)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, bm25({FTS_TABLE}, 10.0, 1.0) AS rank '
+                f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                'ORDER BY rank LIMIT %s', [match, limit])
+            # bm25() is negative, and lower is better
+            return [(*decode_rowid(rowid), -rank) for rowid, rank in cursor]
+
+
+class MemoryIndex:
+    """
+    Pure-Python inverted index, for databases without FTS5. It is built
+    from the database on first use and kept up to date by the same
+    signals as the FTS5 index, but only within the current process.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.postings = None
+        self.tokens = []
+        self.documents = {}
+
+    def ensure_built(self):
+        if self.postings is None:
+            self.rebuild()
+
+    def rebuild(self):
+        with self.lock:
+            self.postings = defaultdict(dict)
+            self.tokens = []
+            self.documents = {}
+            for document in documents():
+                self._add(*document)
+            self.tokens.sort()
+
+    def _add(self, kind, pk, title, url, insert=False):
+        key = (kind, pk)
+        counts = defaultdict(float)
+        for token in tokenize(title):
+            counts[token] += 10.0
+        for token in tokenize(url):
+            counts[token] += 1.0
+        self.documents[key] = list(counts)
+        for token, weight in counts.items():
+            if token not in self.postings:
+                if insert:
+                    insort(self.tokens, token)
+                else:
+                    self.tokens.append(token)
+            self.postings[token][key] = weight
+
+    def _remove(self, key):
+        for token in self.documents.pop(key, ()):
+            self.postings[token].pop(key, None)
+
+    def add(self, kind, pk, title, url):
+        if self.postings is None:
+            return
+        with self.lock:
+            self._remove((kind, pk))
+            self._add(kind, pk, title, url, insert=True)
+
+    def remove(self, kind, pk):
+        if self.postings is None:
+            return
+        with self.lock:
+            self._remove((kind, pk))
+
+    def expand(self, prefix):
+        # All indexed tokens starting with the prefix
+        i = bisect_left(self.tokens, prefix)
+        while i < len(self.tokens) and self.tokens[i].startswith(prefix):
+            yield self.tokens[i]
+            i += 1
+
+    def query(self, tokens, limit):
+        self.ensure_built()
+        total = max(len(self.documents), 1)
+        with self.lock:
+            # For each token, the postings of the indexed tokens it is a
+            # prefix of, with their idf
+            terms = []
+            for token in tokens:
+                terms.append([(self.postings[match],
+                               math.log(1 + total / len(self.postings[match])))
+                              for match in self.expand(token)
+                              if self.postings[match]])
+            # Start from the rarest term and only look up the remaining
+            # candidates in the others, rather than merging whole posting
+            # lists of common words.
+            terms.sort(key=lambda term: sum(len(p) for p, _ in term))
+            scores = defaultdict(float)
+            for postings, idf in terms[0]:
+                for key, weight in postings.items():
+                    scores[key] += weight * idf
+            for term in terms[1:]:
+                matched = {}
+                for key, score in scores.items():
+                    extra = sum(postings[key] * idf for postings, idf in term
+                                if key in postings)
+                    if extra:
+                        matched[key] = score + extra
+                scores = matched
+
+        best = sorted(scores.items(), key=lambda item: -item[1])
+        return [(kind, pk, score) for (kind, pk), score in best[:limit]]
+
+
+_memory_index = MemoryIndex()
+
+
+def get_index():
+    backend = getattr(settings, 'RANGO_SEARCH_BACKEND', 'auto')
+    if backend == 'fts5' or (backend == 'auto' and FTS5Index.available()):
+        return FTS5Index()
+    return _memory_index
+
+
+def index_category(category):
+    get_index().add(CATEGORY, category.pk, category.name, '')
+
+
+def index_page(page):
+    get_index().add(PAGE, page.pk, page.title, page.url)
+
+
+def unindex(kind, pk):
+    get_index().remove(kind, pk)
+
+
+def rebuild():
+    get_index().rebuild()
+
+
+def search(query, limit=20):
+    """
+    Search categories and pages for the words in the query, returning at
+    most limit results as dictionaries (type, id, title, url, views and
+    score), best first.
+
+    Text relevance comes from the index; it is then boosted by the
+    logarithm of the object's views, read live from the database, so
+    popular pages rank higher without reindexing on every view.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+
+    # Rank a few more candidates than we need, as the views boost may
+    # reorder them.
+    matches = get_index().query(tokens, limit * 5)
+    ids = {kind: [pk for k, pk, _ in matches if k == kind] for kind in KINDS}
+    categories = Category.objects.in_bulk(ids[CATEGORY])
+    pages = Page.objects.in_bulk(ids[PAGE])
+
+    weight = getattr(settings, 'RANGO_SEARCH_VIEWS_WEIGHT', 0.1)
+    results = []
+    for kind, pk, relevance in matches:
+        if kind == CATEGORY and pk in categories:
+            category = categories[pk]
+            result = {'title': category.name, 'views': category.views,
+                      'url': reverse('rango:show_category',
+                                     args=[category.slug])}
+        elif kind == PAGE and pk in pages:
+            page = pages[pk]
+            result = {'title': page.title, 'views': page.views,
+                      'url': page.url}
+        else:
+            # Deleted since it was indexed
+            continue
+        result.update({
+            'type': kind,
+            'id': pk,
+            'score': relevance * (1 + weight *
+                                  math.log1p(max(result['views'], 0))),
+        })
+        results.append(result)
+
+    results.sort(key=lambda result: -result['score'])
+    return results[:limit]
@@ -0,0 +1,78 @@
+import time
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends import cached_db
+from django.contrib.sessions.backends.base import CreateError
+from django.utils import timezone
+
+
+class SessionStore(cached_db.SessionStore):
+    """
+    Session engine for traffic that is mostly anonymous: sessions live in
+    the cache (SESSION_CACHE_ALIAS), and only those of logged-in users are
+    written through to the database as well, so they survive the cache
+    being cleared or a session being evicted.
+
+    An anonymous visitor's session (e.g. Rango's visit counter) therefore
+    never becomes a django_session row. Like every engine, it is only
+    created once something is stored in it: SessionMiddleware doesn't
+    save an empty session.
+
+    Use it with SESSION_ENGINE = 'rango.sessions', and a cache shared by
+    every process (memcached, redis, ...) when running more than one.
+    """
+
+    def __init__(self, session_key=None):
+        # Whether the session has a database row to update
+        self._stored = False
+        super().__init__(session_key)
+
+    def load(self):
+        data = super().load()
+        # Only logged-in users' sessions were written to the database.
+        self._stored = SESSION_KEY in data
+        return data
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        if SESSION_KEY not in data:
+            # Anonymous: cache only. A new session must not take over
+            # a key another request has just created.
+            if must_create:
+                if not self._cache.add(self.cache_key, data,
+                                       self.get_expiry_age()):
+                    raise CreateError
+            else:
+                self._cache.set(self.cache_key, data, self.get_expiry_age())
+            return
+        # A user who just logged in doesn't have a row yet.
+        super().save(must_create=must_create or not self._stored)
+        self._stored = True
+
+    @classmethod
+    def clear_expired(cls, batch_size=1000, pause=0):
+        """
+        Delete the expired sessions from the database batch_size at a
+        time, each batch in its own short transaction, sleeping `pause`
+        seconds between batches so other writers get the table in
+        between. Expired sessions in the cache just expire. Returns the
+        number of sessions deleted.
+
+        Django's clearsessions command calls this too.
+        """
+        model = cls.get_model_class()
+        deleted = 0
+        while True:
+            # Found through the index on expire_date
+            now = timezone.now()
+            expired = model.objects.filter(expire_date__lt=now)
+            keys = list(expired.values_list('session_key',
+                                            flat=True)[:batch_size])
+            if not keys:
+                return deleted
+            # Still expired: a session extended since it was found stays
+            count, _ = expired.filter(session_key__in=keys).delete()
+            deleted += count
+            if pause:
+                time.sleep(pause)
@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rango import caching, search
+from rango.leaderboards import (top_categories, top_pages,
+                                trending_categories, trending_pages)
+from rango.models import Category, Page
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    # Any change to a category (name, slug, or the category disappearing)
+    # changes the sidebar, so throw away the cached list. Every category
+    # page shows the sidebar, so this also invalidates those pages.
+    caching.invalidate_category_list()
+    # Its slug may have changed, or be free (or taken) now.
+    caching.category_lookup.forget(instance)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    top_categories.record(instance)
+    trending_categories.record(instance)
+    search.index_category(instance)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    top_categories.discard(instance)
+    trending_categories.discard(instance)
+    search.unindex(search.CATEGORY, instance.pk)
+
+
+@receiver(post_save, sender=Page)
+@receiver(post_delete, sender=Page)
+def page_changed(sender, instance, **kwargs):
+    # Adding, changing or removing a page changes its category's page.
+    try:
+        caching.invalidate_category(instance.category.slug)
+    except Category.DoesNotExist:
+        # The whole category is being deleted, which already invalidated
+        # every category page.
+        pass
+
+
+@receiver(post_save, sender=Page)
+def page_saved(sender, instance, **kwargs):
+    top_pages.record(instance)
+    trending_pages.record(instance)
+    search.index_page(instance)
+
+
+@receiver(post_delete, sender=Page)
+def page_deleted(sender, instance, **kwargs):
+    top_pages.discard(instance)
+    trending_pages.discard(instance)
+    search.unindex(search.PAGE, instance.pk)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    # Tune every new SQLite connection with RANGO_SQLITE_PRAGMAS. They
+    # are run on the raw connection, so they aren't counted as queries.
+    if connection.vendor == 'sqlite':
+        for name, value in getattr(settings, 'RANGO_SQLITE_PRAGMAS',
+                                   {}).items():
+            connection.connection.execute(f'PRAGMA {name} = {value}')
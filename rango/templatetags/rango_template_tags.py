@@ -1,9 +1,55 @@
+from functools import lru_cache
 from django import template
-from rango.models import Category
+from django.conf import settings
+from django.template import Context
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+from rango import caching, images
 
 register = template.Library()
 
 @register.inclusion_tag('rango/categories.html')
 def get_category_list(current_category=None):
-    return {'categories': Category.objects.all(),
-            'current_category': current_category}
\ No newline at end of file
+    return {'categories': caching.get_category_list(),
+            'current_category': current_category}
+
+
+@register.simple_tag
+def profile_picture(profile, variant='thumbnail'):
+    # URL of a resized variant (thumbnail, medium or webp) of the profile's
+    # picture, falling back to the original until it has been processed
+    return images.picture_url(profile, variant)
+
+
+@lru_cache(maxsize=None)
+def static_url(name):
+    # URLs without arguments don't change while the process runs, so
+    # each is only reversed once
+    return reverse(name)
+
+
+@register.simple_tag
+def rango_url(name):
+    # {% url name %} for URLs without arguments, e.g. in loops
+    return static_url(name)
+
+
+# The rendered navigation, keyed on whether the user is logged in
+_navigation = {}
+
+
+@register.simple_tag(takes_context=True)
+def navigation(context):
+    # The navigation links at the bottom of every page only depend on
+    # whether the user is logged in, so (with RANGO_CACHE_TEMPLATES) each
+    # version is rendered once per process.
+    user = context.get('user')
+    authenticated = bool(user and user.is_authenticated)
+    html = _navigation.get(authenticated)
+    if html is None:
+        html = context.template.engine.get_template(
+            'rango/navigation.html').render(
+                Context({'authenticated': authenticated}))
+        if getattr(settings, 'RANGO_CACHE_TEMPLATES', False):
+            _navigation[authenticated] = html
+    return mark_safe(html)
@@ -1,3 +1,1483 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.base import CreateError
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import OperationalError, connection
+from django.db.models import QuerySet
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rango import (assets, caching, images, linkcheck, loadtest, search,
+                   trending, urls)
+from rango.benchmarks import seed
+from rango.counters import counters
+from rango.dedup import merge_duplicates
+from rango.forms import PageForm
+from rango.leaderboards import top_pages, trending_categories
+from rango.loader import load
+from rango.metrics import QueryBudgetExceeded, get_budget
+from rango.routers import ReplicaMiddleware, ReplicaRouter, primary
+from rango.sessions import SessionStore
+from rango.models import (Category, Event, HourlyCount, Like, Page,
+                          Rollup, UserProfile)
+from rango.templatetags import rango_template_tags
+from rango.urlnorm import canonical_url, url_hash
+from rango.templatetags.rango_template_tags import profile_picture
 
-# Create your tests here.
+class CategoryListCacheTests(TestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        Category.objects.create(name='Python')
+
+    def test_sidebar_is_cached(self):
+        caching.get_category_list()
+        with self.assertNumQueries(0):
+            categories = caching.get_category_list()
+        self.assertEqual(categories[0]['slug'], 'python')
+        self.assertEqual(categories[0]['url'],
+                         reverse('rango:show_category', args=['python']))
+
+    def test_saving_a_category_invalidates_the_sidebar(self):
+        caching.get_category_list()
+        Category.objects.create(name='Django')
+        names = [c['name'] for c in caching.get_category_list()]
+        self.assertEqual(names, ['Python', 'Django'])
+
+    def test_deleting_a_category_invalidates_the_sidebar(self):
+        caching.get_category_list()
+        Category.objects.get(slug='python').delete()
+        self.assertEqual(caching.get_category_list(), [])
+
+    def test_evicted_versions_are_not_reused(self):
+        caching.get_category_list()
+        Category.objects.create(name='Django')
+        caching.get_category_list()
+        # The version counter is evicted between two writes
+        caching.get_cache().delete(caching.CATEGORY_LIST_VERSION_KEY)
+        Category.objects.create(name='Flask')
+        names = [c['name'] for c in caching.get_category_list()]
+        self.assertEqual(names, ['Python', 'Django', 'Flask'])
+
+    def test_current_category_is_highlighted(self):
+        response = self.client.get(reverse('rango:show_category',
+                                           args=['python']))
+        self.assertRegex(response.content.decode(),
+                         r'<strong>\s*<a href="/rango/category/python/">')
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        self.category = Category.objects.create(name='Python')
+        self.pages = [Page.objects.create(category=self.category,
+                                          title=f'Page {i}',
+                                          url=f'http://example.com/{i}/',
+                                          views=i * 10)
+                      for i in range(8)]
+
+    def titles(self):
+        return [entry['title'] for entry in top_pages.get()]
+
+    def test_leaderboard_matches_sorted_query(self):
+        expected = [p.title for p in Page.objects.order_by('-views')[:5]]
+        self.assertEqual(self.titles(), expected)
+        with self.assertNumQueries(0):
+            top_pages.get()
+
+    def test_saved_page_is_merged_without_a_query(self):
+        top_pages.get()
+        page = self.pages[0]
+        page.views = 1000
+        page.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles()[0], 'Page 0')
+
+    def test_page_dropping_out_is_replaced(self):
+        top_pages.get()
+        page = self.pages[7]
+        page.views = 0
+        page.save()
+        self.assertEqual(self.titles(),
+                         ['Page 6', 'Page 5', 'Page 4', 'Page 3', 'Page 2'])
+
+    def test_deleted_page_is_replaced(self):
+        top_pages.get()
+        self.pages[7].delete()
+        self.assertEqual(self.titles(),
+                         ['Page 6', 'Page 5', 'Page 4', 'Page 3', 'Page 2'])
+
+@override_settings(RANGO_COUNTER_FLUSH_INTERVAL=0)
+class TrackUrlTests(TestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        category = Category.objects.create(name='Python')
+        self.page = Page.objects.create(category=category, title='Docs',
+                                        url='http://docs.python.org/')
+
+    def tearDown(self):
+        # Don't leak unflushed clicks into other tests
+        counters.pending.clear()
+
+    def test_click_redirects_without_writing(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('rango:goto'),
+                                       {'page_id': self.page.id})
+        self.assertRedirects(response, 'http://docs.python.org/',
+                             fetch_redirect_response=False)
+
+    def test_clicks_are_counted_on_flush(self):
+        for _ in range(3):
+            self.client.get(reverse('rango:goto'), {'page_id': self.page.id})
+        counters.flush()
+        self.page.refresh_from_db()
+        self.assertEqual(self.page.views, 3)
+        self.assertEqual(top_pages.get()[0]['views'], 3)
+
+    def test_unknown_page_redirects_to_index(self):
+        for page_id in ('', 'abc', '999'):
+            response = self.client.get(reverse('rango:goto'),
+                                       {'page_id': page_id})
+            self.assertRedirects(response, reverse('rango:index'))
+
+# Counts the writes to django_session, so uses the database engine
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db')
+class VisitorCookieTests(TestCase):
+    def session_writes(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        writes = [q for q in queries
+                  if q['sql'].startswith(('INSERT', 'UPDATE'))]
+        return response, len(writes)
+
+    def test_repeat_visits_do_not_write_the_session(self):
+        response, writes = self.session_writes(reverse('rango:about'))
+        self.assertEqual(response.context['visits'], 1)
+        self.assertEqual(writes, 1)
+        response, writes = self.session_writes(reverse('rango:about'))
+        self.assertEqual(response.context['visits'], 1)
+        self.assertEqual(writes, 0)
+
+    def test_visit_counted_after_a_day(self):
+        self.client.get(reverse('rango:about'))
+        session = self.client.session
+        session['last_visit'] = int(time.time()) - 2 * 24 * 60 * 60
+        session.save()
+        response = self.client.get(reverse('rango:about'))
+        self.assertEqual(response.context['visits'], 2)
+        self.assertIsInstance(self.client.session['last_visit'], int)
+
+    def test_old_timestamp_format_is_accepted(self):
+        self.client.get(reverse('rango:about'))
+        session = self.client.session
+        session['visits'] = 3
+        session['last_visit'] = '2023-01-01 12:00:00.000000'
+        session.save()
+        response = self.client.get(reverse('rango:about'))
+        self.assertEqual(response.context['visits'], 4)
+
+class SessionStoreTests(TestCase):
+    def setUp(self):
+        caches[settings.SESSION_CACHE_ALIAS].clear()
+
+    def test_anonymous_sessions_stay_out_of_the_database(self):
+        for _ in range(3):
+            response = self.client.get(reverse('rango:about'))
+        self.assertEqual(response.context['visits'], 1)
+        self.assertIn('visits', self.client.session)
+        self.assertFalse(Session.objects.exists())
+
+    def test_logged_in_sessions_are_written_through(self):
+        User.objects.create_user('alice', password='secret')
+        self.client.get(reverse('rango:about'))
+        self.client.post(reverse('rango:login'),
+                         {'username': 'alice', 'password': 'secret'})
+        self.assertEqual(Session.objects.count(), 1)
+
+        # They survive the cache being cleared
+        caches[settings.SESSION_CACHE_ALIAS].clear()
+        response = self.client.get(reverse('rango:about'))
+        self.assertEqual(response.context['user'].username, 'alice')
+        self.assertEqual(response.context['visits'], 1)
+
+        self.client.get(reverse('rango:logout'))
+        self.assertFalse(Session.objects.exists())
+
+    def test_new_sessions_do_not_take_over_existing_keys(self):
+        session = SessionStore()
+        session['visits'] = 1
+        session.create()
+        other = SessionStore(session.session_key)
+        other['visits'] = 2
+        with self.assertRaises(CreateError):
+            other.save(must_create=True)
+        self.assertEqual(SessionStore(session.session_key)['visits'], 1)
+
+    def test_expired_sessions_are_deleted_in_batches(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f'expired{i}', session_data='',
+                     expire_date=now - timedelta(days=1)) for i in range(25)] +
+            [Session(session_key=f'live{i}', session_data='',
+                     expire_date=now + timedelta(days=1)) for i in range(5)])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(SessionStore.clear_expired(batch_size=10), 25)
+        self.assertEqual(
+            sum(1 for q in queries if q['sql'].startswith('DELETE')), 3)
+        self.assertEqual(Session.objects.count(), 5)
+
+    def test_sessions_extended_meanwhile_are_kept(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f'expired{i}', session_data='',
+                     expire_date=now - timedelta(days=1)) for i in range(5)])
+        delete = QuerySet.delete
+
+        def extend_then_delete(queryset):
+            # The user comes back between the SELECT and the DELETE
+            Session.objects.filter(session_key='expired0').update(
+                expire_date=now + timedelta(days=1))
+            return delete(queryset)
+
+        with mock.patch.object(QuerySet, 'delete', extend_then_delete):
+            self.assertEqual(SessionStore.clear_expired(), 4)
+        self.assertEqual(Session.objects.get().session_key, 'expired0')
+
+class CategoryLookupTests(TestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        caching.category_lookup.clear()
+        self.category = Category.objects.create(name='Python')
+
+    def test_hot_slugs_are_looked_up_once(self):
+        caching.category_lookup.get('python')
+        with self.assertNumQueries(0):
+            category = caching.category_lookup.get('python')
+        self.assertEqual(category, self.category)
+        self.assertEqual(category.name, 'Python')
+
+    def test_unknown_slugs_are_remembered(self):
+        with self.assertRaises(Category.DoesNotExist):
+            caching.category_lookup.get('django')
+        with self.assertNumQueries(0):
+            with self.assertRaises(Category.DoesNotExist):
+                caching.category_lookup.get('django')
+
+        # Until a category takes the slug
+        Category.objects.create(name='Django')
+        self.assertEqual(caching.category_lookup.get('django').name,
+                         'Django')
+
+    def test_renaming_forgets_the_old_slug(self):
+        caching.category_lookup.get('python')
+        self.category.name = 'Python 3'
+        self.category.save()
+        with self.assertRaises(Category.DoesNotExist):
+            caching.category_lookup.get('python')
+        self.assertEqual(caching.category_lookup.get('python-3'),
+                         self.category)
+
+    def test_deleting_forgets_the_category(self):
+        caching.category_lookup.get('python')
+        self.category.delete()
+        with self.assertRaises(Category.DoesNotExist):
+            caching.category_lookup.get('python')
+
+    @override_settings(RANGO_CATEGORY_LOOKUP_SIZE=2)
+    def test_least_recently_used_entries_are_evicted(self):
+        for slug in ('python', 'a', 'b'):
+            caching.category_lookup.get_row(slug)
+        self.assertEqual(list(caching.category_lookup.entries), ['a', 'b'])
+
+    @override_settings(RANGO_CATEGORY_LOOKUP_SHARED=True)
+    def test_shared_tier(self):
+        caching.category_lookup.get('python')
+        caching.category_lookup.clear()
+        with self.assertNumQueries(0):
+            caching.category_lookup.get('python')
+
+
+class CategoryPageCacheTests(TestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        self.category = Category.objects.create(name='Python')
+        self.url = reverse('rango:show_category', args=['python'])
+
+    def test_anonymous_page_is_served_from_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'No pages currently in category.')
+        self.assertNotContains(response, 'Add Page')
+
+    def test_unchanged_page_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_adding_a_page_invalidates_the_cache(self):
+        etag = self.client.get(self.url)['ETag']
+        Page.objects.create(category=self.category, title='Docs',
+                            url='http://docs.python.org/')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Docs')
+
+    def test_renaming_a_category_invalidates_the_cache(self):
+        self.client.get(self.url)
+        self.category.name = 'Snake'
+        self.category.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'The specified category does not exist.')
+
+    def test_authenticated_users_get_the_add_page_link(self):
+        self.client.get(self.url)
+        User.objects.create_user('rango', password='secret')
+        self.client.login(username='rango', password='secret')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Add Page')
+        self.assertFalse(response.has_header('ETag'))
+
+    @override_settings(CACHES=dict(settings.CACHES, rango={
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'rango-tests',
+    }), RANGO_CACHE_ALIAS='rango')
+    def test_page_list_is_cached_in_rangos_cache(self):
+        page = Page.objects.create(category=self.category, title='Docs',
+                                   url='http://docs.python.org/')
+        User.objects.create_user('rango', password='secret')
+        self.client.login(username='rango', password='secret')
+        self.client.get(self.url)
+        # Not through save(), so the cached list isn't invalidated
+        Page.objects.filter(pk=page.pk).update(title='Tutorial')
+        caches['default'].clear()
+        self.assertContains(self.client.get(self.url), 'Docs')
+        caches['rango'].clear()
+        self.assertContains(self.client.get(self.url), 'Tutorial')
+
+class LoaderTests(TestCase):
+    rows = [
+        {'category': 'Python', 'category_likes': '64', 'title': 'Docs',
+         'url': 'http://docs.python.org/', 'views': '65'},
+        {'category': 'Python', 'title': 'Tutorial',
+         'url': 'http://docs.python.org/3/tutorial/', 'views': '16'},
+        {'category': 'Django', 'title': 'Docs',
+         'url': 'https://docs.djangoproject.com/', 'views': '22'},
+    ]
+
+    def test_rows_are_loaded_in_few_queries(self):
+        with self.assertNumQueries(11):
+            stats = load(self.rows)
+        self.assertEqual(stats, {'rows': 3, 'created': 5, 'updated': 0})
+        self.assertEqual(Category.objects.get(slug='python').likes, 64)
+        self.assertEqual(Page.objects.filter(category__slug='python').count(),
+                         2)
+
+    def test_loading_twice_changes_nothing(self):
+        load(self.rows)
+        stats = load(self.rows)
+        self.assertEqual(stats, {'rows': 3, 'created': 0, 'updated': 0})
+        self.assertEqual(Page.objects.count(), 3)
+
+    def test_changed_rows_are_updated(self):
+        load(self.rows)
+        stats = load([dict(self.rows[0], views='100')], batch_size=1)
+        self.assertEqual(stats['updated'], 1)
+        self.assertEqual(Page.objects.get(title='Docs',
+                                          category__slug='python').views, 100)
+
+    def test_loaded_pages_are_listed(self):
+        caching.get_cache().clear()
+        load(self.rows)
+        url = reverse('rango:show_category', args=['python'])
+        self.assertNotContains(self.client.get(url), 'Library')
+        load([{'category': 'Python', 'title': 'Library',
+               'url': 'http://docs.python.org/3/library/'}])
+        self.assertContains(self.client.get(url), 'Library')
+
+@override_settings(RANGO_CATEGORY_PAGE_SIZE=2)
+class CategoryPaginationTests(TestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        category = Category.objects.create(name='Python')
+        for i, views in enumerate([5, 9, 5, 1, 7]):
+            Page.objects.create(category=category, title=f'Page {i}',
+                                url=f'http://example.com/{i}/', views=views)
+        self.url = reverse('rango:show_category', args=['python'])
+
+    def walk(self, order):
+        titles = []
+        data = {'order': order}
+        while True:
+            pages = self.client.get(self.url, data).context['pages']
+            titles += [page.title for page in pages.items]
+            if not pages.next_cursor:
+                return titles
+            data['after'] = pages.next_cursor
+
+    def test_pages_by_views(self):
+        self.assertEqual(self.walk('views'),
+                         ['Page 1', 'Page 4', 'Page 2', 'Page 0', 'Page 3'])
+
+    def test_pages_by_id(self):
+        self.assertEqual(self.walk('id'),
+                         ['Page 0', 'Page 1', 'Page 2', 'Page 3', 'Page 4'])
+
+    def test_invalid_cursor_starts_from_the_top(self):
+        response = self.client.get(self.url, {'after': 'bogus'})
+        self.assertEqual([page.title for page in response.context['pages'].items],
+                         ['Page 1', 'Page 4'])
+
+    def test_export_streams_every_page(self):
+        response = self.client.get(
+            reverse('rango:export_category', args=['python']), {'order': 'id'})
+        pages = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([page['title'] for page in pages],
+                         ['Page 0', 'Page 1', 'Page 2', 'Page 3', 'Page 4'])
+
+    def test_html_export_escapes_titles(self):
+        Page.objects.create(category=Category.objects.get(slug='python'),
+                            title='<b>', url='http://example.com/b/')
+        response = self.client.get(
+            reverse('rango:export_category', args=['python']),
+            {'format': 'html'})
+        self.assertIn(b'&lt;b&gt;', b''.join(response.streaming_content))
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.python = Category.objects.create(name='Python')
+        django = Category.objects.create(name='Django')
+        Page.objects.create(category=self.python, title='Python Tutorial',
+                            url='http://docs.python.org/3/tutorial/',
+                            views=10)
+        Page.objects.create(category=self.python, title='Python Tutorial',
+                            url='http://example.com/python/', views=1000)
+        Page.objects.create(category=django, title='Django Rocks',
+                            url='http://www.djangorocks.com/')
+
+    def titles(self, query):
+        return [(result['type'], result['title'])
+                for result in search.search(query)]
+
+    def check_search(self):
+        self.assertCountEqual(self.titles('djang'),
+                              [('category', 'Django'), ('page', 'Django Rocks')])
+        self.assertEqual(self.titles('python tutorial'),
+                         [('page', 'Python Tutorial')] * 2)
+        # Equally relevant, so the most viewed page comes first
+        self.assertEqual(search.search('tutorial')[0]['views'], 1000)
+        self.assertEqual(self.titles('cobol'), [])
+
+    def check_index_is_kept_current(self):
+        page = Page.objects.get(title='Django Rocks')
+        page.title = 'Flask'
+        page.save()
+        self.assertEqual(self.titles('flask'), [('page', 'Flask')])
+        self.python.delete()
+        self.assertEqual(self.titles('tutorial'), [])
+
+    def test_fts5_search(self):
+        self.assertIsInstance(search.get_index(), search.FTS5Index)
+        self.check_search()
+        self.check_index_is_kept_current()
+
+    @override_settings(RANGO_SEARCH_BACKEND='memory')
+    def test_memory_search(self):
+        search.rebuild()
+        self.check_search()
+        self.check_index_is_kept_current()
+
+    def test_search_api(self):
+        response = self.client.get(reverse('rango:api_search'),
+                                   {'q': 'rocks'})
+        self.assertEqual(response.json()['results'][0]['title'],
+                         'Django Rocks')
+
+    def test_search_api_limit(self):
+        url = reverse('rango:api_search')
+        for limit, expected in (('1', 1), ('-1', 1), ('0', 1), ('1000', 2)):
+            response = self.client.get(url, {'q': 'tutorial', 'limit': limit})
+            self.assertEqual(len(response.json()['results']), expected)
+        response = self.client.get(url, {'q': 'tutorial', 'limit': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+class ApiTests(TestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        category = Category.objects.create(name='Python', likes=3)
+        Category.objects.create(name='Django')
+        for i in range(3):
+            Page.objects.create(category=category, title=f'Page {i}',
+                                url=f'http://example.com/{i}/', views=i)
+
+    def test_categories_with_sparse_fields(self):
+        response = self.client.get(reverse('rango:api_categories'),
+                                   {'fields': 'name,slug', 'limit': 1})
+        self.assertEqual(response.json(), {
+            'results': [{'name': 'Python', 'slug': 'python'}],
+            'next': str(Category.objects.get(slug='python').id),
+        })
+        response = self.client.get(reverse('rango:api_categories'),
+                                   {'fields': 'name',
+                                    'after': response.json()['next']})
+        self.assertEqual(response.json(),
+                         {'results': [{'name': 'Django'}], 'next': None})
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(reverse('rango:api_category',
+                                           args=['python']),
+                                   {'fields': 'name,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_category_pages(self):
+        url = reverse('rango:api_category_pages', args=['python'])
+        response = self.client.get(url, {'fields': 'title', 'limit': 2})
+        data = response.json()
+        self.assertEqual(data['results'],
+                         [{'title': 'Page 2'}, {'title': 'Page 1'}])
+        response = self.client.get(url, {'fields': 'title',
+                                         'after': data['next']})
+        self.assertEqual(response.json()['results'], [{'title': 'Page 0'}])
+
+    def test_unknown_category_is_not_found(self):
+        response = self.client.get(reverse('rango:api_category_pages',
+                                           args=['cobol']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_unchanged_response_is_not_modified(self):
+        url = reverse('rango:api_top')
+        response = self.client.get(url)
+        self.assertEqual(response.json()['categories'][0]['name'], 'Python')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+@override_settings(RANGO_COUNTER_FLUSH_INTERVAL=0,
+                   RANGO_QUERY_BUDGET_ERRORS=True)
+class QueryBudgetTests(TestCase):
+    # Each view with a query budget (RANGO_QUERY_BUDGETS in settings.py)
+    # and a request exercising it (rango:goto's is added by setUp, as it
+    # needs the id of a page)
+    requests = {
+        'rango:index': ((), {}),
+        'rango:about': ((), {}),
+        'rango:show_category': (('python',), {}),
+        'rango:export_category': (('python',), {}),
+        'rango:search': ((), {'q': 'python'}),
+        'rango:api_categories': ((), {}),
+        'rango:api_category': (('python',), {}),
+        'rango:api_category_pages': (('python',), {}),
+        'rango:api_top': ((), {}),
+        'rango:api_trending': ((), {}),
+        'rango:api_search': ((), {'q': 'python'}),
+    }
+
+    def setUp(self):
+        category = Category.objects.create(name='Python')
+        for i in range(30):
+            page = Page.objects.create(category=category,
+                                       title=f'Python {i}',
+                                       url=f'http://example.com/{i}/',
+                                       views=i)
+        self.requests = dict(self.requests,
+                             **{'rango:goto': ((), {'page_id': page.id})})
+
+    def tearDown(self):
+        counters.pending.clear()
+
+    def test_every_budget_is_checked(self):
+        self.assertEqual(set(self.requests),
+                         set(settings.RANGO_QUERY_BUDGETS))
+
+    def test_views_stay_within_their_query_budgets(self):
+        # The budgets are for the steady state: a returning visitor,
+        # with the caches warmed up by the first request.
+        for view, (args, data) in self.requests.items():
+            with self.subTest(view=view):
+                self.client.get(reverse(view, args=args), data)
+                response = self.client.get(reverse(view, args=args), data)
+                self.assertLess(response.status_code, 400)
+                self.assertLessEqual(response.metrics['queries'],
+                                     get_budget(view))
+
+    @override_settings(RANGO_QUERY_BUDGETS={'rango:show_category': 0})
+    def test_going_over_budget_fails(self):
+        url = reverse('rango:show_category', args=['python'])
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(url)
+        # A warning in production
+        caching.get_cache().clear()
+        with override_settings(RANGO_QUERY_BUDGET_ERRORS=False), \
+                self.assertLogs('rango.metrics', 'WARNING'):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_queries_filling_caches_are_not_budgeted(self):
+        caching.get_cache().clear()
+        response = self.client.get(reverse('rango:api_top'))
+        self.assertEqual(response.metrics['queries'], 2)
+        self.assertEqual(response.metrics['cache_queries'], 2)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('rango:about'))
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="\d+ queries", '
+                         r'tpl;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_metrics_are_only_served_to_staff(self):
+        self.client.get(reverse('rango:about'))
+        url = reverse('rango:api_metrics')
+        # Not even locally, as behind a reverse proxy
+        response = self.client.get(url, REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 404)
+        with override_settings(RANGO_METRICS_FOR_INTERNAL_IPS=True):
+            self.assertEqual(self.client.get(
+                url, REMOTE_ADDR='10.0.0.1').status_code, 404)
+            self.assertEqual(self.client.get(
+                url, REMOTE_ADDR='127.0.0.1').status_code, 200)
+
+        self.client.force_login(User.objects.create_user('alice'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(User.objects.create_user('admin',
+                                                         is_staff=True))
+        response = self.client.get(url)
+        self.assertGreater(response.json()['rango:about']['requests'], 0)
+
+
+@override_settings(RANGO_QUERY_BUDGET_ERRORS=True)
+class FirstVisitQueryBudgetTests(TransactionTestCase):
+    # A TransactionTestCase, so that writing the session starts (and
+    # commits) a real transaction, as outside the tests, rather than
+    # making a savepoint.
+    def setUp(self):
+        caching.get_cache().clear()
+        caches[settings.SESSION_CACHE_ALIAS].clear()
+        Category.objects.create(name='Python')
+
+    def test_first_page_after_logging_in(self):
+        User.objects.create_user('alice', password='secret')
+        self.client.login(username='alice', password='secret')
+        response = self.client.get(reverse('rango:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['user'].username, 'alice')
+
+    @override_settings(
+        SESSION_ENGINE='django.contrib.sessions.backends.db')
+    def test_anonymous_visits_with_database_sessions(self):
+        for view in ('rango:index', 'rango:about', 'rango:about'):
+            with self.subTest(view=view):
+                response = self.client.get(reverse(view))
+                self.assertEqual(response.status_code, 200)
+        self.assertTrue(Session.objects.exists())
+
+
+class LoadTestTests(TransactionTestCase):
+    # A TransactionTestCase, so that the live server's thread (with its
+    # own connection) sees the seeded data.
+    def setUp(self):
+        caching.get_cache().clear()
+        seed(categories=2, pages_per_category=3)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(loadtest.percentile(values, 0.50), 50)
+        self.assertEqual(loadtest.percentile(values, 0.99), 99)
+        self.assertEqual(loadtest.percentile(values, 1.0), 100)
+        self.assertEqual(loadtest.percentile([7], 0.01), 7)
+
+    def test_every_url_has_a_scenario(self):
+        scenarios = {name: (method, path, data)
+                     for name, method, path, data, _ in loadtest.scenarios()}
+        self.assertEqual(set(scenarios),
+                         {pattern.name for pattern in urls.urlpatterns})
+        category = Category.objects.order_by('id').first()
+        self.assertEqual(scenarios['show_category'][1],
+                         reverse('rango:show_category', args=[category.slug]))
+        self.assertEqual(scenarios['login'][0], 'POST')
+        # Views that would create data are only read
+        self.assertEqual(scenarios['add_category'][0], 'GET')
+
+    def test_urls_are_driven_against_a_live_server(self):
+        results = loadtest.run(requests=4, concurrency=2,
+                               only={'index', 'show_category', 'logout'})
+        self.assertEqual(set(results),
+                         {'index', 'show_category', 'logout'})
+        for name, result in results.items():
+            with self.subTest(name=name):
+                self.assertEqual(result['requests'], 4)
+                self.assertEqual(result['errors'], 0)
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+                self.assertIsNotNone(result['queries_per_request'])
+
+
+class ProfilePictureTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        output = BytesIO()
+        Image.new('RGB', (800, 600), 'red').save(output, 'PNG')
+        user = User.objects.create_user('alice', password='secret')
+        self.profile = UserProfile(user=user)
+        self.profile.picture.save('alice.png', ContentFile(output.getvalue()))
+
+    def test_original_is_served_until_processed(self):
+        self.assertEqual(self.profile.picture_hash, '')
+        self.assertEqual(profile_picture(self.profile),
+                         self.profile.picture.url)
+
+    def test_variants_are_generated(self):
+        images.process_picture(self.profile.pk)
+        self.profile.refresh_from_db()
+        self.assertEqual(len(self.profile.picture_hash), 32)
+
+        for variant, (size, format, _) in images.VARIANTS.items():
+            name = images.variant_name(self.profile.picture_hash, variant)
+            with default_storage.open(name) as f:
+                image = Image.open(f)
+                self.assertEqual(image.format, format)
+                self.assertEqual(max(image.size), size)
+        self.assertTrue(profile_picture(self.profile, 'webp')
+                        .endswith('_webp.webp'))
+
+    def test_identical_pictures_share_variants(self):
+        images.process_picture(self.profile.pk)
+        self.profile.refresh_from_db()
+        other = UserProfile.objects.create(
+            user=User.objects.create_user('bob'),
+            picture=self.profile.picture.name)
+        images.process_picture(other.pk)
+        other.refresh_from_db()
+        self.assertEqual(other.picture_hash, self.profile.picture_hash)
+
+
+@override_settings(RANGO_LOGIN_RATE_LIMITS={'ip': (5, 60),
+                                            'username': (3, 60)})
+class LoginTests(TestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        self.user = User.objects.create_user('alice', password='secret')
+
+    def attempt(self, password, username='alice', **extra):
+        return self.client.post(reverse('rango:login'),
+                                {'username': username, 'password': password},
+                                **extra)
+
+    def test_login(self):
+        response = self.attempt('secret')
+        self.assertRedirects(response, reverse('rango:index'))
+
+    def test_outdated_hashes_are_upgraded_on_login(self):
+        with override_settings(RANGO_PBKDF2_ITERATIONS=1000):
+            self.user.set_password('secret')
+            self.user.save()
+        self.assertIn('$1000$', self.user.password)
+
+        self.attempt('secret')
+        self.user.refresh_from_db()
+        self.assertIn(f'${settings.RANGO_PBKDF2_ITERATIONS}$',
+                      self.user.password)
+        self.assertTrue(self.user.check_password('secret'))
+
+    def test_default_cost_hashes_are_rehashed_on_login(self):
+        # A hash made before the costs were lowered, with Django's own
+        # number of iterations
+        self.assertLess(settings.RANGO_PBKDF2_ITERATIONS,
+                        PBKDF2PasswordHasher.iterations)
+        self.user.password = make_password('secret',
+                                           hasher=PBKDF2PasswordHasher())
+        self.user.save()
+
+        self.assertRedirects(self.attempt('secret'), reverse('rango:index'))
+        self.user.refresh_from_db()
+        algorithm, iterations, _, _ = self.user.password.split('$')
+        self.assertEqual(algorithm, 'pbkdf2_sha256')
+        self.assertEqual(int(iterations), settings.RANGO_PBKDF2_ITERATIONS)
+        self.assertTrue(self.user.check_password('secret'))
+
+    def test_attempts_per_username_are_limited(self):
+        for _ in range(3):
+            self.assertEqual(self.attempt('wrong').status_code, 200)
+        response = self.attempt('secret')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+    def test_attempts_per_ip_are_limited(self):
+        for i in range(5):
+            self.attempt('wrong', username=f'user{i}')
+        self.assertEqual(self.attempt('secret').status_code, 429)
+        response = self.attempt('secret', REMOTE_ADDR='10.0.0.1')
+        self.assertRedirects(response, reverse('rango:index'))
+
+    def test_successful_login_resets_the_username_limit(self):
+        self.attempt('wrong')
+        self.attempt('wrong')
+        self.attempt('secret')
+        self.client.logout()
+        self.assertEqual(self.attempt('wrong').status_code, 200)
+        self.assertEqual(self.attempt('wrong').status_code, 200)
+
+
+class StaticAssetTests(TestCase):
+    def setUp(self):
+        source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source)
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        os.mkdir(os.path.join(source, 'css'))
+        with open(os.path.join(source, 'css', 'rango.css'), 'w') as f:
+            f.write('body { margin: 0; }\n' * 100)
+
+        settings_override = override_settings(
+            STATICFILES_DIRS=[source], STATIC_ROOT=self.static_root,
+            STATICFILES_STORAGE=
+            'rango.assets.CompressedManifestStaticFilesStorage')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.hashed_name = staticfiles_storage.stored_name('css/rango.css')
+
+    def serve(self, path, **headers):
+        return assets.serve(RequestFactory().get('/static/' + path, **headers),
+                            path)
+
+    def test_files_are_hashed_and_precompressed(self):
+        self.assertRegex(self.hashed_name, r'^css/rango\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.static_root,
+                               self.hashed_name + '.gz'), 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()).decode(),
+                             'body { margin: 0; }\n' * 100)
+
+    def test_hashed_files_are_cached_forever(self):
+        response = self.serve(self.hashed_name, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content))
+                         .decode(), 'body { margin: 0; }\n' * 100)
+
+    def test_uncompressed_for_clients_not_accepting_gzip(self):
+        response = self.serve(self.hashed_name,
+                              HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_unhashed_files_are_revalidated(self):
+        response = self.serve('css/rango.css')
+        self.assertIn('max-age=0', response['Cache-Control'])
+        response = self.serve('css/rango.css',
+                              HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+
+class ConnectionSettingsTests(TestCase):
+    @override_settings(RANGO_SQLITE_PRAGMAS={'cache_size': -1234,
+                                             'synchronous': 'NORMAL'})
+    def test_pragmas_are_applied_on_connect(self):
+        other = connection.copy()
+        self.addCleanup(other.close)
+        with other.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -1234)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+@override_settings(RANGO_REPLICAS=['replica1', 'replica2'],
+                   RANGO_REPLICA_SELECTION='round_robin')
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def route(self, request, model=Category, lags=None):
+        # The databases the router picks for three reads of model during
+        # the request, and the response
+        databases = []
+
+        def view(request):
+            for _ in range(3):
+                databases.append(self.router.db_for_read(model))
+            return HttpResponse()
+
+        lags = lags or {'replica1': 0, 'replica2': 0}
+        with mock.patch('rango.routers.replica_lag', lags.get):
+            response = ReplicaMiddleware(view)(request)
+        return databases, response
+
+    def test_safe_requests_read_from_the_replicas_in_turn(self):
+        databases, _ = self.route(self.factory.get('/'))
+        self.assertEqual(databases, ['replica1', 'replica2', 'replica1'])
+
+    def test_reads_for_caches_go_to_the_primary(self):
+        databases = []
+
+        def view(request):
+            databases.append(self.router.db_for_read(Category))
+            with primary():
+                databases.append(self.router.db_for_read(Category))
+            databases.append(self.router.db_for_read(Category))
+            return HttpResponse()
+
+        with mock.patch('rango.routers.replica_lag',
+                        {'replica1': 0, 'replica2': 0}.get):
+            ReplicaMiddleware(view)(self.factory.get('/'))
+        self.assertEqual(databases, ['replica1', None, 'replica2'])
+
+    def test_other_applications_read_from_the_primary(self):
+        databases, _ = self.route(self.factory.get('/'), User)
+        self.assertEqual(databases, [None] * 3)
+
+    def test_writers_stay_on_the_primary(self):
+        databases, response = self.route(self.factory.post('/'))
+        self.assertEqual(databases, [None] * 3)
+        pin = response.cookies['rango_primary']
+        self.assertEqual(pin['max-age'], settings.RANGO_REPLICA_PIN_SECONDS)
+
+        request = self.factory.get('/')
+        request.COOKIES['rango_primary'] = pin.value
+        databases, _ = self.route(request)
+        self.assertEqual(databases, [None] * 3)
+
+    def test_outside_requests_read_from_the_primary(self):
+        self.assertIsNone(self.router.db_for_read(Category))
+        self.assertEqual(self.router.db_for_write(Category), 'default')
+
+    @override_settings(RANGO_REPLICA_SELECTION='least_lag',
+                       RANGO_REPLICA_MAX_LAG=30)
+    def test_least_lagging_replica_is_picked(self):
+        databases, _ = self.route(self.factory.get('/'),
+                                  lags={'replica1': 5, 'replica2': 1})
+        self.assertEqual(databases, ['replica2'] * 3)
+        # Unless it's too far behind
+        databases, _ = self.route(self.factory.get('/'),
+                                  lags={'replica1': 5, 'replica2': 60})
+        self.assertEqual(databases, ['replica1'] * 3)
+
+
+class NavigationTests(TestCase):
+    def setUp(self):
+        rango_template_tags._navigation.clear()
+        self.addCleanup(rango_template_tags._navigation.clear)
+
+    def test_navigation_depends_on_login(self):
+        response = self.client.get(reverse('rango:about'))
+        self.assertContains(response, reverse('rango:login'))
+        self.assertNotContains(response, reverse('rango:logout'))
+
+        User.objects.create_user('alice', password='secret')
+        self.client.login(username='alice', password='secret')
+        response = self.client.get(reverse('rango:about'))
+        self.assertContains(response, reverse('rango:logout'))
+        self.assertNotContains(response, reverse('rango:login'))
+
+    @override_settings(RANGO_CACHE_TEMPLATES=True)
+    def test_navigation_is_rendered_once_per_login_state(self):
+        self.client.get(reverse('rango:about'))
+        self.client.get(reverse('rango:index'))
+        self.assertEqual(list(rango_template_tags._navigation), [False])
+        self.assertIn(reverse('rango:search'),
+                      rango_template_tags._navigation[False])
+
+    def test_navigation_is_not_kept_in_development(self):
+        self.client.get(reverse('rango:about'))
+        self.assertEqual(rango_template_tags._navigation, {})
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # A few canned responses for the link checker tests, counting the
+    # requests the server is handling at once.
+    protocol_version = 'HTTP/1.1'
+    lock = threading.Lock()
+    in_flight = max_in_flight = 0
+    conditional = 0
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            time.sleep(0.02)
+            self.respond()
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def respond(self):
+        if self.path == '/moved':
+            self.send_response(301)
+            self.send_header('Location', '/page')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/page' and \
+                self.headers.get('If-None-Match') == '"v1"':
+            type(self).conditional += 1
+            self.send_response(304)
+            self.end_headers()
+        elif self.path in ('/page', '/other'):
+            body = b'<html><head><title>\n Rango &amp; Django </title>'
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == '/host':
+            body = f'<title>{self.headers["Host"]}</title>'.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == '/chunked':
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for chunk in (b'<title>Chun', b'ked</title>'):
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            self.send_error(404)
+
+    def log_message(self, *args):
+        pass
+
+
+class LinkCheckTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StubHandler.max_in_flight = StubHandler.conditional = 0
+        category = Category.objects.create(name='Python')
+        for path in ('page', 'moved', 'chunked', 'missing', 'other'):
+            Page.objects.create(category=category, title=path,
+                                url=f'{self.base}/{path}')
+        Page.objects.create(category=category, title='unreachable',
+                            url='http://127.0.0.1:1/')
+
+    def check(self, **options):
+        return linkcheck.check_batch(host_delay=0, **options)
+
+    def test_pages_are_checked(self):
+        self.check()
+        pages = {page.title: page for page in Page.objects.all()}
+        self.assertEqual(pages['page'].link_status, 200)
+        self.assertEqual(pages['page'].link_title, 'Rango & Django')
+        self.assertEqual(pages['page'].link_etag, '"v1"')
+        self.assertEqual(pages['moved'].link_title, 'Rango & Django')
+        self.assertEqual(pages['chunked'].link_title, 'Chunked')
+        self.assertEqual(pages['missing'].link_status, 404)
+        self.assertTrue(pages['missing'].link_dead)
+        self.assertEqual(pages['unreachable'].link_status, 0)
+        self.assertTrue(all(page.link_checked for page in pages.values()))
+
+    def test_pages_are_checked_in_batches(self):
+        self.assertEqual(len(self.check(batch_size=4)), 4)
+        self.assertEqual(len(self.check(batch_size=4)), 2)
+        self.assertEqual(self.check(batch_size=4), [])
+
+    def test_rechecks_are_conditional(self):
+        self.check()
+        self.check(interval=timedelta(0))
+        self.assertEqual(StubHandler.conditional, 1)
+        page = Page.objects.get(title='page')
+        self.assertEqual(page.link_status, 200)
+        self.assertEqual(page.link_title, 'Rango & Django')
+
+    def test_addresses_without_a_host_are_unreachable(self):
+        category = Category.objects.get()
+        for url in ('example.com/foo', 'mailto:rango@example.com',
+                    'http:///x'):
+            Page.objects.create(category=category, title=url, url=url)
+        self.check()
+        for url in ('example.com/foo', 'mailto:rango@example.com',
+                    'http:///x'):
+            with self.subTest(url=url):
+                page = Page.objects.get(title=url)
+                self.assertEqual(page.link_status, 0)
+                self.assertIsNotNone(page.link_checked)
+        self.assertEqual(Page.objects.get(title='page').link_status, 200)
+
+    def test_one_failing_page_does_not_stop_the_batch(self):
+        check = linkcheck.check
+
+        async def failing_check(url, *args):
+            if url.endswith('/other'):
+                raise TypeError('unexpected')
+            return await check(url, *args)
+
+        with mock.patch.object(linkcheck, 'check', failing_check), \
+                self.assertLogs('rango.linkcheck', 'ERROR'):
+            self.assertEqual(len(self.check()), 6)
+        self.assertEqual(Page.objects.get(title='other').link_status, 0)
+        self.assertEqual(Page.objects.get(title='page').link_status, 200)
+
+    def test_host_header_has_no_credentials(self):
+        page = Page.objects.create(
+            category=Category.objects.get(), title='host',
+            url=self.base.replace('//', '//user:secret@') + '/host')
+        self.check()
+        page.refresh_from_db()
+        self.assertEqual(page.link_title, self.base.split('//')[1])
+
+    def test_requests_per_host_are_limited(self):
+        self.check(per_host=1)
+        self.assertEqual(StubHandler.max_in_flight, 1)
+        Page.objects.update(link_checked=None)
+        self.check(per_host=3)
+        self.assertEqual(StubHandler.max_in_flight, 3)
+
+
+class DuplicateUrlTests(TestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        self.category = Category.objects.create(name='Python')
+
+    def test_canonical_url(self):
+        for url, canonical in [
+            ('Docs.Python.ORG', 'http://docs.python.org/'),
+            ('HTTPS://docs.python.org:443/3/', 'https://docs.python.org/3'),
+            ('http://example.com:8000/a/#top', 'http://example.com:8000/a'),
+            ('http://example.com/?b=2&utm_source=x&a=1&fbclid=y',
+             'http://example.com/?a=1&b=2'),
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(canonical_url(url), canonical)
+        self.assertEqual(url_hash('http://example.com/a/'),
+                         url_hash('https://EXAMPLE.com/a?utm_medium=email'))
+        self.assertNotEqual(url_hash('http://example.com/a'),
+                            url_hash('http://example.com/b'))
+
+    def test_form_rejects_urls_already_in_the_category(self):
+        Page.objects.create(category=self.category, title='Docs',
+                            url='https://docs.python.org/3/')
+        data = {'title': 'Docs', 'url': 'http://docs.python.org/3?utm_x=1',
+                'views': 0}
+        form = PageForm(data, category=self.category)
+        self.assertFalse(form.is_valid())
+        self.assertIn('url', form.errors)
+
+        other = Category.objects.create(name='Django')
+        self.assertTrue(PageForm(data, category=other).is_valid())
+
+    def test_form_keeps_the_url_as_entered(self):
+        for url, cleaned in [
+                ('docs.python.org/3/', 'http://docs.python.org/3/'),
+                ('https://Docs.Python.org/3/?utm_x=1',
+                 'https://Docs.Python.org/3/?utm_x=1')]:
+            with self.subTest(url=url):
+                form = PageForm({'title': 'Docs', 'url': url, 'views': 0},
+                                category=self.category)
+                self.assertTrue(form.is_valid())
+                self.assertEqual(form.cleaned_data['url'], cleaned)
+
+    def test_duplicates_are_merged(self):
+        other = Category.objects.create(name='Django')
+        # Pages from before url_hash existed
+        Page.objects.bulk_create([
+            Page(category=self.category, title='a', url='http://a.com/',
+                 views=1),
+            Page(category=self.category, title='b', url='http://b.com',
+                 views=2),
+            Page(category=self.category, title='a again',
+                 url='https://A.com?utm_source=x', views=3),
+            Page(category=other, title='a', url='http://a.com', views=4),
+        ])
+        # and one since, which the older duplicates are merged into
+        Page.objects.create(category=self.category, title='b again',
+                            url='http://b.com/', views=5)
+
+        stats = merge_duplicates(batch_size=2)
+        self.assertEqual(stats, {'pages': 4, 'merged': 2})
+        pages = Page.objects.order_by('category', 'url')
+        self.assertEqual(
+            [(page.category.name, page.title, page.url, page.views)
+             for page in pages],
+            [('Python', 'a', 'http://a.com/', 4),
+             ('Python', 'b again', 'http://b.com/', 7),
+             ('Django', 'a', 'http://a.com', 4)])
+        self.assertFalse(Page.objects.filter(url_hash__isnull=True).exists())
+
+    def test_merged_pages_leave_the_page_list(self):
+        Page.objects.bulk_create([
+            Page(category=self.category, title='Docs',
+                 url='http://docs.python.org/'),
+            Page(category=self.category, title='Docs again',
+                 url='https://docs.python.org'),
+        ])
+        url = reverse('rango:show_category', args=['python'])
+        self.assertContains(self.client.get(url), 'Docs again')
+        merge_duplicates()
+        self.assertNotContains(self.client.get(url), 'Docs again')
+
+@override_settings(RANGO_COUNTER_FLUSH_INTERVAL=0,
+                   RANGO_TRENDING_ROLLUP_DELAY=0)
+class TrendingTests(TestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        self.python = Category.objects.create(name='Python')
+        self.django = Category.objects.create(name='Django')
+        self.docs = Page.objects.create(category=self.python, title='Docs',
+                                        url='http://docs.python.org/')
+        self.tutorial = Page.objects.create(category=self.django,
+                                            title='Tutorial',
+                                            url='http://djangoproject.com/')
+        self.now = timezone.now()
+
+    def tearDown(self):
+        counters.pending.clear()
+
+    def log(self, page, count, hours_ago=0):
+        Event.objects.create(kind=Event.PAGE_VIEW, object_id=page.id,
+                             count=count,
+                             created=self.now - timedelta(hours=hours_ago))
+
+    def names(self):
+        return [entry['name']
+                for entry in trending.trending(trending_categories)]
+
+    def test_recent_activity_outranks_older_activity(self):
+        # 100 views two days (two half-lives) ago count for 25 now
+        self.log(self.docs, 100, hours_ago=48)
+        self.log(self.tutorial, 30)
+        trending.roll_up()
+        self.assertEqual(self.names(), ['Django', 'Python'])
+        scores = [entry['trend']
+                  for entry in trending.trending(trending_categories)]
+        self.assertAlmostEqual(scores[0] / scores[1], 30 / 25, delta=0.05)
+
+    def test_only_new_events_are_rolled_up(self):
+        self.log(self.docs, 2)
+        self.log(self.docs, 3, hours_ago=1)
+        self.assertEqual(trending.roll_up(), 2)
+        self.assertEqual(trending.roll_up(), 0)
+        self.log(self.docs, 4)
+        self.assertEqual(trending.roll_up(batch_size=1), 1)
+        self.assertEqual(Rollup.objects.get().last_event_id,
+                         Event.objects.latest('id').id)
+        self.assertEqual(
+            sorted(HourlyCount.objects.values_list('count', flat=True)),
+            [3, 6])
+
+        # Events are counted, not ids
+        self.log(self.docs, 5)
+        Event.objects.create(kind=Event.PAGE_VIEW, object_id=0).delete()
+        self.log(self.docs, 6)
+        self.assertEqual(trending.roll_up(), 2)
+
+        # Rebuilding from the hourly counts gives the same scores
+        trend = Category.objects.get(pk=self.python.pk).trend
+        trending.rebuild()
+        self.assertAlmostEqual(Category.objects.get(pk=self.python.pk).trend,
+                               trend)
+
+    @override_settings(RANGO_TRENDING_ROLLUP_DELAY=60)
+    def test_recent_events_are_left_for_the_next_run(self):
+        self.log(self.docs, 2, hours_ago=1)
+        # Logged after, but from a transaction that committed late
+        self.log(self.docs, 3)
+        self.log(self.docs, 4, hours_ago=1)
+        self.log(self.docs, 5)
+        self.assertEqual(trending.roll_up(), 3)
+        with override_settings(RANGO_TRENDING_ROLLUP_DELAY=0):
+            self.assertEqual(trending.roll_up(), 1)
+
+    def test_taking_likes_back_takes_them_out_of_the_trend(self):
+        user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(user)
+        url = reverse('rango:api_like', args=['python'])
+        for _ in range(3):
+            self.client.put(url)
+            trending.roll_up()
+            self.client.delete(url)
+            trending.roll_up()
+            self.assertEqual(Category.objects.get(pk=self.python.pk).trend, 0)
+        self.client.put(url)
+        trending.roll_up()
+
+        hour = HourlyCount.objects.latest('hour').hour
+        one_like = trending.add(0, settings.RANGO_TRENDING_LIKE_WEIGHT, hour)
+        self.assertAlmostEqual(Category.objects.get(pk=self.python.pk).trend,
+                               one_like)
+        trending.rebuild()
+        self.assertAlmostEqual(Category.objects.get(pk=self.python.pk).trend,
+                               one_like)
+
+    def test_flushed_views_and_the_api(self):
+        for _ in range(3):
+            self.client.get(reverse('rango:goto'),
+                            {'page_id': self.tutorial.id})
+        counters.flush()
+        self.assertEqual(Event.objects.get().count, 3)
+        trending.roll_up()
+
+        data = self.client.get(reverse('rango:api_trending')).json()
+        self.assertEqual([entry['name'] for entry in data['categories']],
+                         ['Django'])
+        self.assertEqual([entry['title'] for entry in data['pages']],
+                         ['Tutorial'])
+        self.assertGreater(data['pages'][0]['trend'], 2)
+        self.assertContains(self.client.get(reverse('rango:index')),
+                            'Trending')
+
+class LikeTests(TransactionTestCase):
+    # A TransactionTestCase, so that the likers' threads (each with its
+    # own connection) see the same data.
+    def setUp(self):
+        caching.get_cache().clear()
+        self.category = Category.objects.create(name='Python')
+        self.url = reverse('rango:api_like', args=['python'])
+
+    def in_parallel(self, method, users, workers=16):
+        # Send one request per user from a pool of threads, each with its
+        # own database connection. The in-memory SQLite test database
+        # fails a write that finds its table locked rather than waiting,
+        # so those requests are retried, as a client retries a failed
+        # request; being idempotent, the retries are harmless.
+        clients = []
+        for user in users:
+            client = self.client_class()
+            client.force_login(user)
+            clients.append(client)
+
+        def send(client):
+            try:
+                for attempt in range(100):
+                    try:
+                        return getattr(client, method)(self.url).status_code
+                    except OperationalError:
+                        time.sleep(random.random() * 0.01 * attempt)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(workers) as pool:
+            statuses = list(pool.map(send, clients))
+        self.assertEqual(set(statuses), {200})
+
+    def test_like_and_unlike_are_idempotent(self):
+        user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(user)
+        for _ in range(2):
+            data = self.client.put(self.url).json()
+            self.assertEqual(data, {'liked': True, 'likes': 1})
+        self.assertEqual(self.client.get(self.url).json()['liked'], True)
+        for _ in range(2):
+            data = self.client.delete(self.url).json()
+            self.assertEqual(data, {'liked': False, 'likes': 0})
+        self.assertEqual(Category.objects.get().likes, 0)
+
+    def test_anonymous_users_cannot_like(self):
+        self.assertEqual(self.client.put(self.url).status_code, 403)
+        self.client.force_login(User.objects.create_user('alice'))
+        self.assertEqual(
+            self.client.put(reverse('rango:api_like',
+                                    args=['nothing'])).status_code, 404)
+
+    def test_parallel_likers_are_all_counted(self):
+        User.objects.bulk_create(
+            [User(username=f'user{i}') for i in range(200)])
+        users = list(User.objects.order_by('id'))
+        # Everyone likes it at once, and half of them twice
+        self.in_parallel('put', users + users[:100])
+        self.assertEqual(Category.objects.get().likes, 200)
+        self.assertEqual(Like.objects.count(), 200)
+
+        # Half of them take it back at once
+        self.in_parallel('delete', users[100:])
+        self.assertEqual(Category.objects.get().likes, 100)
+        self.assertEqual(Like.objects.count(), 100)
+
+@override_settings(RANGO_ADMIN_COUNT_LIMIT=10, RANGO_ADMIN_BATCH_SIZE=7)
+class AdminTests(TestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        self.client.force_login(User.objects.create_superuser(
+            'admin', 'admin@example.com', 'secret'))
+        self.python = Category.objects.create(name='Python')
+        self.django = Category.objects.create(name='Django')
+        self.pages = [Page.objects.create(category=self.python,
+                                          title=f'Python {i}',
+                                          url=f'http://example.com/{i}/',
+                                          views=i)
+                      for i in range(150)]
+        self.url = reverse('admin:rango_page_changelist')
+
+    def test_changelist_is_paged_by_primary_key(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        sql = ' '.join(q['sql'] for q in queries)
+        # No COUNT(*) of the table, and no query per row for the category
+        self.assertNotIn('COUNT(', sql)
+        self.assertLess(len(queries), 15)
+        self.assertContains(response, 'about 150 pages')
+
+        cl = response.context['cl']
+        self.assertEqual(cl.result_list[0], self.pages[-1])
+        response = self.client.get(self.url, {'after': cl.next_cursor})
+        self.assertEqual(response.context['cl'].result_list[0],
+                         self.pages[-101])
+        self.assertIsNone(response.context['cl'].next_cursor)
+
+    def test_search_uses_the_index(self):
+        response = self.client.get(self.url, {'q': 'http://EXAMPLE.com/7'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [self.pages[7]])
+
+    def post_action(self, action, **data):
+        return self.client.post(self.url, {
+            'action': action, 'index': 0, 'select_across': 1,
+            '_selected_action': [self.pages[0].pk], **data})
+
+    def test_reset_views_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.post_action('reset_views')
+        updates = [q for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 22)  # 150 pages, 7 at a time
+        self.assertFalse(Page.objects.exclude(views=0).exists())
+
+    def test_move_to_category(self):
+        Page.objects.create(category=self.django, title='Taken',
+                            url='http://example.com/3')
+        response = self.post_action('move_to_category')
+        self.assertContains(response, 'Move pages')
+        self.post_action('move_to_category', category='django', apply=1)
+        self.assertEqual(Page.objects.filter(category=self.django).count(),
+                         150)
+        self.assertEqual(
+            list(Page.objects.filter(category=self.python)
+                 .values_list('title', flat=True)), ['Python 3'])
@@ -0,0 +1,211 @@
+import math
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from rango.leaderboards import trending_categories, trending_pages
+from rango.models import Category, Event, HourlyCount, Page, Rollup
+
+# Trend scores are stored as the logarithm of
+#     sum(count * e ** (rate * (time - EPOCH)))
+# over every hourly count, i.e. the decayed score scaled up by a factor
+# common to every row. Ranking by it ranks by decayed score at any time,
+# so rows only need updating when they get new events, and the log keeps
+# the numbers in range however far we get from the epoch.
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+# Event kinds recorded for the counters buffered by rango.counters (likes
+# are logged by rango.api.like)
+COUNTER_EVENTS = {(Page, 'views'): Event.PAGE_VIEW}
+
+# Rows looked up or written per statement
+CHUNK_SIZE = 500
+
+
+def decay_rate():
+    # Per second, from the half-life of a score
+    return math.log(2) / getattr(settings, 'RANGO_TRENDING_HALF_LIFE',
+                                 24 * 60 * 60)
+
+
+def add(trend, count, when):
+    # The log-scale score trend, plus count events at time when. A
+    # negative count (likes taken back) takes them out again, down to no
+    # activity at all.
+    if not count:
+        return trend
+    term = math.log(abs(count)) + \
+        decay_rate() * (when - EPOCH).total_seconds()
+    if count < 0:
+        if not trend or term >= trend:
+            return 0.0
+        return trend + math.log1p(-math.exp(term - trend))
+    if not trend:
+        return term
+    high, low = max(trend, term), min(trend, term)
+    return high + math.log1p(math.exp(low - high))
+
+
+def score(trend, at=None):
+    """
+    The decayed score for a stored trend, as of the start of the current
+    hour (so that it doesn't change between two requests in the hour).
+    """
+    if not trend:
+        return 0.0
+    at = at or timezone.now().replace(minute=0, second=0, microsecond=0)
+    return math.exp(trend - decay_rate() * (at - EPOCH).total_seconds())
+
+
+def log_events(events):
+    # Append (kind, object_id, count) events to the log
+    Event.objects.bulk_create(
+        [Event(kind=kind, object_id=object_id, count=count)
+         for kind, object_id, count in events if count],
+        batch_size=CHUNK_SIZE)
+
+
+def chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def add_to_trends(model, contributions):
+    # Fold {id: [(count, hour), ...]} into the trend of model's rows
+    table = connection.ops.quote_name(model._meta.db_table)
+    for ids in chunks(contributions):
+        rows = model.objects.filter(id__in=ids).values_list('id', 'trend')
+        updates = []
+        for id, trend in rows:
+            for count, hour in contributions[id]:
+                trend = add(trend, count, hour)
+            updates.append((trend, id))
+        with connection.cursor() as cursor:
+            cursor.executemany(f'UPDATE {table} SET trend = %s WHERE id = %s',
+                               updates)
+
+
+def add_counts(counts):
+    """
+    Fold (kind, object_id, hour, count) hourly counts into the trends of
+    the pages and categories they are for. A page's views count towards
+    its category's trend too, and a like for RANGO_TRENDING_LIKE_WEIGHT
+    views.
+    """
+    like_weight = getattr(settings, 'RANGO_TRENDING_LIKE_WEIGHT', 10)
+    page_views = {}
+    categories = {}
+    for kind, object_id, hour, count in counts:
+        if kind == Event.PAGE_VIEW:
+            page_views.setdefault(object_id, []).append((count, hour))
+        elif kind == Event.CATEGORY_LIKE:
+            categories.setdefault(object_id, []).append(
+                (count * like_weight, hour))
+    for ids in chunks(page_views):
+        for id, category_id in Page.objects.filter(id__in=ids) \
+                .values_list('id', 'category_id'):
+            categories.setdefault(category_id, []).extend(page_views[id])
+
+    add_to_trends(Page, page_views)
+    add_to_trends(Category, categories)
+
+
+def roll_up_range(first_id, last_id):
+    """
+    Add the events with ids in [first_id, last_id] to the hourly counts
+    and the trend scores. Returns the number of events rolled up.
+    """
+    rows = list(Event.objects
+                .filter(id__gte=first_id, id__lte=last_id)
+                .annotate(hour=TruncHour('created'))
+                .values_list('kind', 'object_id', 'hour')
+                .annotate(total=Sum('count'), events=Count('id'))
+                .order_by())
+    if not rows:
+        return 0
+    groups = [row[:4] for row in rows]
+
+    # Upsert the hourly counts: one statement, run for every group
+    table = connection.ops.quote_name(HourlyCount._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} (kind, object_id, hour, count) '
+            f'VALUES (%s, %s, %s, %s) '
+            f'ON CONFLICT (kind, object_id, hour) '
+            f'DO UPDATE SET count = {table}.count + excluded.count',
+            [(kind, object_id,
+              connection.ops.adapt_datetimefield_value(hour), total)
+             for kind, object_id, hour, total in groups])
+
+    add_counts(groups)
+    return sum(row[4] for row in rows)
+
+
+def roll_up(batch_size=100000):
+    """
+    Roll the events logged since the last run up into hourly counts and
+    trend scores, batch_size ids per transaction. Only new events are
+    read: the log is never scanned again. Run it on a schedule (see the
+    roll_up_trending command). Returns the number of events rolled up.
+
+    An event's id is given out when it is inserted, but the event is only
+    seen once its transaction commits, so it can be seen after events
+    with newer ids. Only the events up to the newest one older than
+    RANGO_TRENDING_ROLLUP_DELAY seconds are rolled up, leaving any still
+    being committed for the next run.
+    """
+    delay = getattr(settings, 'RANGO_TRENDING_ROLLUP_DELAY', 60)
+    settled = timezone.now() - timedelta(seconds=delay)
+    last_id = Rollup.objects.filter(name='trending') \
+        .values_list('last_event_id', flat=True).first() or 0
+    # Found by seeking past the events already rolled up
+    newest = Event.objects.filter(id__gt=last_id, created__lte=settled) \
+        .aggregate(newest=Max('id'))['newest'] or 0
+    rolled_up = 0
+    while True:
+        with transaction.atomic():
+            state, _ = Rollup.objects.select_for_update() \
+                .get_or_create(name='trending')
+            if state.last_event_id >= newest:
+                break
+            last_id = min(state.last_event_id + batch_size, newest)
+            rolled_up += roll_up_range(state.last_event_id + 1, last_id)
+            state.last_event_id = last_id
+            state.save(update_fields=['last_event_id'])
+
+    if rolled_up:
+        # The trends were updated without saving instances
+        trending_categories.invalidate()
+        trending_pages.invalidate()
+    return rolled_up
+
+
+def rebuild():
+    """
+    Recompute every trend score from the hourly counts, e.g. after
+    changing RANGO_TRENDING_HALF_LIFE.
+    """
+    with transaction.atomic():
+        Page.objects.update(trend=0)
+        Category.objects.update(trend=0)
+        last_id = 0
+        while True:
+            buckets = list(HourlyCount.objects.filter(id__gt=last_id)
+                           .order_by('id')
+                           .values_list('id', 'kind', 'object_id', 'hour',
+                                        'count')[:CHUNK_SIZE * 20])
+            if not buckets:
+                break
+            last_id = buckets[-1][0]
+            add_counts(bucket[1:] for bucket in buckets)
+    trending_categories.invalidate()
+    trending_pages.invalidate()
+
+
+def trending(leaderboard):
+    # The leaderboard's entries with any activity, with their scores
+    return [dict(entry, trend=score(entry['trend']))
+            for entry in leaderboard.get() if entry['trend']]
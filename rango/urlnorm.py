@@ -0,0 +1,59 @@
+import hashlib
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters added by analytics and ad tools, which don't change
+# the page a URL points to
+TRACKING_PARAMS = re.compile(
+    r'^(utm_\w+|fbclid|gclid|dclid|msclkid|yclid|mc_cid|mc_eid|_ga|_gl|'
+    r'igshid|ref_src)$', re.IGNORECASE)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+HAS_SCHEME = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*://')
+
+
+def canonical_url(url):
+    """
+    The canonical form of a URL, so that addresses of the same page
+    compare equal: http:// is assumed when no scheme is given, the scheme
+    and host are lower-cased, default ports and fragments are dropped,
+    the path loses its trailing slash (but is at least '/'), and tracking
+    parameters are removed from the query, the rest being sorted.
+    """
+    url = url.strip()
+    if not HAS_SCHEME.match(url):
+        url = f'http://{url}'
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+
+    host = (parts.hostname or '').rstrip('.')
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc = f'{host}:{port}'
+    if parts.username:
+        userinfo = parts.username
+        if parts.password:
+            userinfo += f':{parts.password}'
+        netloc = f'{userinfo}@{netloc}'
+
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode(sorted(
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not TRACKING_PARAMS.match(name)))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+def url_hash(url):
+    """
+    Fixed-size key of a URL's canonical form, indexed (uniquely per
+    category) as Page.url_hash. http:// and https:// addresses of a page
+    share their key.
+    """
+    canonical = canonical_url(url).split('://', 1)[1]
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
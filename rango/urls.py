@@ -1,5 +1,5 @@
 from django.urls import path
-from rango import views
+from rango import api, views
 
 app_name = 'rango'
 
@@ -8,8 +8,23 @@ urlpatterns = [
     path('about/', views.about, name='about'),
     path('category/<slug:category_name_slug>/', views.show_category,
          name='show_category'),
+    path('category/<slug:category_name_slug>/export/',
+         views.export_category, name='export_category'),
     path('category/<slug:category_name_slug>/add_page/',
          views.add_page, name='add_page'),
+    path('goto/', views.track_url, name='goto'),
+    path('search/', views.search, name='search'),
+    path('api/categories/', api.categories, name='api_categories'),
+    path('api/categories/<slug:category_name_slug>/', api.category,
+         name='api_category'),
+    path('api/categories/<slug:category_name_slug>/pages/',
+         api.category_pages, name='api_category_pages'),
+    path('api/categories/<slug:category_name_slug>/like/', api.like,
+         name='api_like'),
+    path('api/top/', api.top, name='api_top'),
+    path('api/trending/', api.trending, name='api_trending'),
+    path('api/search/', api.search, name='api_search'),
+    path('api/metrics/', api.metrics, name='api_metrics'),
     path('add_category/', views.add_category, name='add_category'),
     path('register/', views.register, name='register'),
     path('login/', views.user_login, name='login'),
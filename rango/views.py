@@ -1,17 +1,42 @@
-from django.http import HttpResponse
+import json
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.urls import reverse
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.hashers import make_password
+from django.utils.html import format_html
+import time
 from datetime import datetime
 from rango.models import Category, Page
 from rango.forms import CategoryForm, PageForm, UserForm, UserProfileForm
+from rango import images
+from rango.auth import check_login_rate, login_by_username, run_hasher
+from rango.caching import (cache_anonymous_page, category_lookup,
+                           category_page_key, get_cache_alias,
+                           get_category_version)
+from rango.counters import counters
+from rango.leaderboards import (top_categories, top_pages,
+                                trending_categories, trending_pages)
+from rango.pagination import ORDERS, KeysetPage
+from rango.routers import primary
+from rango.search import search as search_index
+from rango.trending import trending
+
+# A visit counts as a new one after this many seconds (a day)
+VISIT_INTERVAL = 24 * 60 * 60
 
 def index(request):
-    # Retrieve the top 5 most liked categories from database
-    top_category_list = Category.objects.order_by('-likes')[:5]
-    # Retrieve the top 5 most viewed pages from database
-    top_page_list = Page.objects.order_by('-views')[:5]
+    # Retrieve the top 5 most liked categories and the top 5 most viewed
+    # pages. Both lists are precomputed and kept up to date as categories
+    # and pages are saved, so they usually come straight from the cache.
+    top_category_list = top_categories.get()
+    top_page_list = top_pages.get()
+    # And what has been busy lately, ranked by time-decayed activity
+    trending_category_list = trending(trending_categories)
+    trending_page_list = trending(trending_pages)
 
     # Call the helper function to handle the visit counter cookies
     visitor_cookie_handler(request)
@@ -20,6 +45,8 @@ def index(request):
         'boldmessage': 'Crunchy, creamy, cookie, candy, cupcake!',
         'categories': top_category_list,
         'pages': top_page_list,
+        'trending_categories': trending_category_list,
+        'trending_pages': trending_page_list,
     }
     return render(request, 'rango/index.html', context=context_dict)
 
@@ -28,62 +55,138 @@ def get_server_side_cookie(request, cookie, default_val=None):
     if not val:
         val = default_val
     return val
-def visitor_cookie_handler(request):
-    # Get the number of visits to the site.
-    # If the cookie is in the session data, we cast the value returned
-    # to an integer.
-    # If not, the default value of 1 is used.
-    visits = int(get_server_side_cookie(request, 'visits', '1'))
-
-    # Get the last visit date/time.
-    # If the cookie is in the session data, we parse the date/time string
-    # to a Python datetime object, stored in the variable last_visit_time,
-    # so we can use it in the comparison below.
-    # If not, we use the current date and time as a default value.
-    last_visit_cookie = get_server_side_cookie(request,
-                                               'last_visit',
-                                               str(datetime.now()))
-    last_visit_time = datetime.strptime(last_visit_cookie[:-7],
-                                        '%Y-%m-%d %H:%M:%S')
-    # If it's been more than a day since the last visit
-    if (datetime.now() - last_visit_time).days > 0:
-        visits = visits + 1
-        # Update the last visit cookie now we have incremented the count
-        request.session['last_visit'] = str(datetime.now())
-    else:
-        # Set the last visit cookie
-        request.session['last_visit'] = last_visit_cookie
 
-    # Update or set the visits cookie
-    request.session['visits'] = visits
+def parse_last_visit(value):
+    # The last visit is stored as a Unix timestamp (an integer). Older
+    # sessions hold the str(datetime.now()) form, which we still accept.
+    if isinstance(value, str):
+        try:
+            return int(datetime.strptime(value[:19],
+                                         '%Y-%m-%d %H:%M:%S').timestamp())
+        except ValueError:
+            return None
+    return value
+
+def visitor_cookie_handler(request):
+    # Get the number of visits to the site and the time of the last
+    # visit, as a Unix timestamp. Either is None on a first visit.
+    visits = get_server_side_cookie(request, 'visits')
+    last_visit = parse_last_visit(get_server_side_cookie(request,
+                                                         'last_visit'))
+    now = int(time.time())
+
+    # Only touch the session when something actually changes: on the
+    # first visit, or when more than a day has passed since the last
+    # one. Assigning to the session marks it as modified, which makes
+    # the session store write it back at the end of the request.
+    if visits is None or last_visit is None:
+        visits = int(visits or 1)
+        request.session['visits'] = visits
+        request.session['last_visit'] = now
+    elif now - last_visit >= VISIT_INTERVAL:
+        visits = int(visits) + 1
+        request.session['visits'] = visits
+        request.session['last_visit'] = now
+
+    return int(visits)
 
 def about(request):
     # Call the helper function to handle the visit counter cookies
-    visitor_cookie_handler(request)
+    visits = visitor_cookie_handler(request)
 
     context_dict = {
         'boldmessage': 'This tutorial has been put together by David Cannon',
-        'visits': int(request.session['visits']),
+        'visits': visits,
     }
     return render(request, 'rango/about.html', context=context_dict)
 
+# Anonymous users all see the same category page, so we serve them a
+# cached copy (see rango.caching) until the category or its pages change.
+@cache_anonymous_page(category_page_key)
 def show_category(request, category_name_slug):
     context_dict = {}
 
+    # Pages are listed a page at a time, most viewed first unless
+    # ?order=id is given, resuming after the ?after= cursor.
+    order = get_page_order(request)
+
     try:
-        # Query database for category with given slug
-        category = Category.objects.get(slug=category_name_slug)
-        # Retrieve all of the associated pages
-        pages = Page.objects.filter(category=category)
+        # Look up the category with the given slug (usually without
+        # a query, see rango.caching.CategoryLookup)
+        category = category_lookup.get(category_name_slug)
+        # Retrieve one page of the associated pages
+        pages = KeysetPage(Page.objects.filter(category=category), order,
+                           request.GET.get('after'),
+                           settings.RANGO_CATEGORY_PAGE_SIZE)
 
         context_dict['pages'] = pages
         context_dict['category'] = category
+        context_dict['order'] = order
+        # The list of pages is cached as a template fragment, keyed on
+        # this version; the query above only runs when it has changed.
+        # It is kept in Rango's cache, with the version.
+        context_dict['pages_version'] = get_category_version(
+            category_name_slug)
+        context_dict['cache_alias'] = get_cache_alias()
     except Category.DoesNotExist:
         # Could not find the category with the given slug
         context_dict['category'] = None
         context_dict['pages'] = None
 
-    return render(request, 'rango/category.html', context=context_dict)
+    # The list of pages is cached in a template fragment, so it is read
+    # (lazily, on a miss) from the primary
+    with primary():
+        return render(request, 'rango/category.html', context=context_dict)
+
+def export_category(request, category_name_slug):
+    # Stream every page of the category, as JSON or (with ?format=html)
+    # as an HTML list. The pages are read from the database in chunks
+    # with iterator() and written out as they arrive, so memory use and
+    # time to first byte don't grow with the size of the category.
+    try:
+        category = category_lookup.get(category_name_slug)
+    except Category.DoesNotExist:
+        raise Http404('The specified category does not exist.')
+
+    pages = Page.objects.filter(category=category) \
+        .order_by(*ORDERS[get_page_order(request)]) \
+        .values('id', 'title', 'url', 'views') \
+        .iterator(chunk_size=2000)
+
+    if request.GET.get('format') == 'html':
+        response = StreamingHttpResponse(stream_html(pages),
+                                         content_type='text/html')
+    else:
+        response = StreamingHttpResponse(stream_json(pages),
+                                         content_type='application/json')
+    return response
+
+def get_page_order(request):
+    order = request.GET.get('order')
+    return order if order in ORDERS else 'views'
+
+def stream_json(pages):
+    yield '['
+    separator = ''
+    for page in pages:
+        yield separator + json.dumps(page)
+        separator = ','
+    yield ']'
+
+def stream_html(pages):
+    yield '<ul>\n'
+    for page in pages:
+        yield format_html('<li><a href="{}">{}</a> ({} views)</li>\n',
+                          page['url'], page['title'], page['views'])
+    yield '</ul>\n'
+
+def search(request):
+    # Search categories and pages for the words in ?q=
+    query = request.GET.get('q', '').strip()
+    results = search_index(query) if query else []
+
+    context_dict = {'query': query, 'results': results}
+    return render(request, 'rango/search.html', context=context_dict)
 
 @login_required
 def add_category(request):
@@ -113,8 +216,8 @@ def add_category(request):
 @login_required
 def add_page(request, category_name_slug):
     try:
-        # Query database for category with given slug
-        category = Category.objects.get(slug=category_name_slug)
+        # Look up the category with the given slug
+        category = category_lookup.get(category_name_slug)
     except Category.DoesNotExist:
         # Could not find the category with the given slug
         category = None
@@ -123,12 +226,12 @@ def add_page(request, category_name_slug):
     if category is None:
         return redirect(reverse('rango:index'))
 
-    form = PageForm()
+    form = PageForm(category=category)
 
     # If we received an HTTP POST request - the user submitted data
     # via the form
     if request.method == 'POST':
-        form = PageForm(request.POST)
+        form = PageForm(request.POST, category=category)
 
         # If we've been provided with a valid form
         if form.is_valid():
@@ -137,13 +240,19 @@ def add_page(request, category_name_slug):
                 page = form.save(commit=False)
                 page.category = category
                 page.views = 0
-                page.save()
-
-                # Now the page is saved, redirect the user back to the
-                # category view.
-                return redirect(reverse('rango:show_category',
-                                        kwargs={'category_name_slug':
-                                                category_name_slug}))
+                try:
+                    with transaction.atomic():
+                        page.save()
+                except IntegrityError:
+                    # The same URL was added since the form checked
+                    form.add_error('url',
+                                   'This page is already in the category.')
+                else:
+                    # Now the page is saved, redirect the user back to
+                    # the category view.
+                    return redirect(reverse('rango:show_category',
+                                            kwargs={'category_name_slug':
+                                                    category_name_slug}))
         else:
             # The supplied form contained errors - print them to the
             # terminal.
@@ -152,6 +261,20 @@ def add_page(request, category_name_slug):
     context_dict = {'form': form, 'category': category}
     return render(request, 'rango/add_page.html', context=context_dict)
 
+def track_url(request):
+    # Redirect the user to the page with the given page_id, counting the
+    # click. The view count is buffered and written in batches (see
+    # rango.counters), so no write happens while the user waits.
+    page_id = request.GET.get('page_id')
+    try:
+        url = Page.objects.values_list('url', flat=True).get(pk=page_id)
+    except (Page.DoesNotExist, ValueError):
+        # No (or an unknown) page_id was provided
+        return redirect(reverse('rango:index'))
+
+    counters.increment(Page, int(page_id), 'views')
+    return redirect(url)
+
 def register(request):
     # A boolean flag for keeping track of if the registration was
     # successful. Initially False, set to true when we successfully
@@ -170,9 +293,9 @@ def register(request):
         if user_form.is_valid() and profile_form.is_valid():
             # Save the user's form data to the database.
             user = user_form.save()
-            # We hash the password with the set_password method.
+            # We hash the password (on the hasher pool, like logins).
             # Once hashed, we can update the user object.
-            user.set_password(user.password)
+            user.password = run_hasher(make_password, user.password)
             user.save()
 
             # Now we can deal with the UserProfile instance.
@@ -190,6 +313,11 @@ def register(request):
             # Now we can save the UserProfile model instance
             profile.save()
 
+            # Resize the picture in the background, so the user doesn't
+            # have to wait for it.
+            if profile.picture:
+                images.schedule(profile)
+
             # Update our flag to indicate the template registration
             # was successful.
             registered = True
@@ -223,6 +351,15 @@ def user_login(request):
         username = request.POST.get('username')
         password = request.POST.get('password')
 
+        # Turn away clients making too many attempts before paying for
+        # hashing the password.
+        retry_after = check_login_rate(request, username)
+        if retry_after:
+            response = HttpResponse("Too many login attempts. "
+                                    "Please try again later.", status=429)
+            response['Retry-After'] = retry_after
+            return response
+
         # Use Django's machinery to attempt to see if the username/
         # password combination is valid - a User object is returned if
         # it is.
@@ -237,6 +374,7 @@ def user_login(request):
                 # If the account is valid and active, we can log the user
                 # in. We'll send the user back to the homepage.
                 login(request, user)
+                login_by_username.reset(username)
                 return redirect(reverse('rango:index'))
             else:
                 # An inactive account was used - we won't log the user in.
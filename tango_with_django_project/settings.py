@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
+import importlib.util
 import os
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -18,16 +19,30 @@ TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
 STATIC_DIR = os.path.join(BASE_DIR, 'static')
 MEDIA_DIR = os.path.join(BASE_DIR, 'media')
 
-# Quick-start development settings - unsuitable for production
+# The settings below are for development unless the RANGO_ENV
+# environment variable is 'production', which turns off DEBUG (which
+# keeps every query in memory), keeps database connections open and
+# caches compiled templates. The other RANGO_* variables override
+# individual settings.
 # See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
+PRODUCTION = os.environ.get('RANGO_ENV') == 'production'
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = '%v*u!rs2i-cje)^6&6ze8z&9lj*#%)p#m0*d%1ej+s*9^y$9mh'
+SECRET_KEY = os.environ.get(
+    'RANGO_SECRET_KEY', '%v*u!rs2i-cje)^6&6ze8z&9lj*#%)p#m0*d%1ej+s*9^y$9mh')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('RANGO_DEBUG', '0' if PRODUCTION else '1') == '1'
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host for host in
+                 os.environ.get('RANGO_ALLOWED_HOSTS', '').split(',') if host]
+
+# The request metrics at /rango/api/metrics/ are served to staff users,
+# and to these addresses too with RANGO_METRICS_FOR_INTERNAL_IPS (leave it
+# off behind a reverse proxy on the same host, whose requests all come
+# from the local host)
+INTERNAL_IPS = ['127.0.0.1', '::1']
+RANGO_METRICS_FOR_INTERNAL_IPS = False
 
 
 # Application definition
@@ -43,6 +58,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so it measures everything below it (see rango.metrics)
+    'rango.metrics.MetricsMiddleware',
+    # Routes the reads of safe requests to the replicas, if any
+    'rango.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,7 +75,9 @@ ROOT_URLCONF = 'tango_with_django_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django's template backend, timing each render for
+        # rango.metrics.MetricsMiddleware
+        'BACKEND': 'rango.metrics.TimedDjangoTemplates',
         'DIRS': [TEMPLATE_DIR, ],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -71,24 +92,150 @@ TEMPLATES = [
     },
 ]
 
+# Compile each template (and render the navigation, see
+# rango_template_tags) once per process, rather than on every render.
+# On in production; templates edited while the server runs are then only
+# picked up on restart.
+RANGO_CACHE_TEMPLATES = os.environ.get(
+    'RANGO_CACHE_TEMPLATES', '1' if PRODUCTION else '0') == '1'
+RANGO_CACHED_TEMPLATE_LOADERS = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+if RANGO_CACHE_TEMPLATES:
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = RANGO_CACHED_TEMPLATE_LOADERS
+
 WSGI_APPLICATION = 'tango_with_django_project.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# SQLite by default; set RANGO_DB_ENGINE=postgresql (and the RANGO_DB_*
+# variables below) to use PostgreSQL. In production, connections are kept
+# open for RANGO_CONN_MAX_AGE seconds rather than opened per request.
+
+if os.environ.get('RANGO_DB_ENGINE') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('RANGO_DB_NAME', 'rango'),
+            'USER': os.environ.get('RANGO_DB_USER', ''),
+            'PASSWORD': os.environ.get('RANGO_DB_PASSWORD', ''),
+            # Point these at a pgbouncer in transaction mode to share a
+            # pool of server connections between processes
+            'HOST': os.environ.get('RANGO_DB_HOST', ''),
+            'PORT': os.environ.get('RANGO_DB_PORT', ''),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('RANGO_DB_NAME',
+                                   os.path.join(BASE_DIR, 'db.sqlite3')),
+        }
     }
+DATABASES['default']['CONN_MAX_AGE'] = int(
+    os.environ.get('RANGO_CONN_MAX_AGE', 600 if PRODUCTION else 0))
+
+# Read replicas (see rango.routers): RANGO_DB_REPLICA_HOSTS lists the
+# PostgreSQL replicas, and RANGO_SQLITE_REPLICAS=n sets up n copies of
+# the SQLite database to try routing out locally (refreshed with the
+# sync_replicas command). Tests use the primary for every alias.
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    replicas = [
+        {'HOST': host} for host in
+        os.environ.get('RANGO_DB_REPLICA_HOSTS', '').split(',') if host]
+else:
+    replicas = [
+        {'NAME': os.path.join(BASE_DIR, f'db.replica{i}.sqlite3')}
+        for i in range(1, int(os.environ.get('RANGO_SQLITE_REPLICAS', 0)) + 1)]
+for i, replica in enumerate(replicas, 1):
+    DATABASES[f'replica{i}'] = dict(DATABASES['default'], **replica,
+                                    TEST={'MIRROR': 'default'})
+RANGO_REPLICAS = [f'replica{i}' for i in range(1, len(replicas) + 1)]
+
+DATABASE_ROUTERS = ['rango.routers.ReplicaRouter']
+
+# Replicas are picked in turn ('round_robin') or by least replication
+# lag ('least_lag', measured every RANGO_REPLICA_LAG_INTERVAL seconds),
+# skipping those over RANGO_REPLICA_MAX_LAG seconds behind. Clients stay
+# on the primary for RANGO_REPLICA_PIN_SECONDS after writing.
+RANGO_REPLICA_SELECTION = 'round_robin'
+RANGO_REPLICA_LAG_INTERVAL = 5
+RANGO_REPLICA_MAX_LAG = 30
+RANGO_REPLICA_PIN_SECONDS = 10
+
+# PRAGMAs run on every new SQLite connection (see rango.signals). In
+# production: write-ahead logging, so readers don't block the writer,
+# fsync only at checkpoints, and larger page and mmap caches.
+RANGO_PRODUCTION_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
 }
+RANGO_SQLITE_PRAGMAS = RANGO_PRODUCTION_SQLITE_PRAGMAS if PRODUCTION else {}
+
+# Session storage. rango.sessions keeps sessions in the cache and only
+# writes logged-in users' to the database too, so anonymous visitors
+# never add rows to django_session (run the clear_expired_sessions
+# command on a schedule to delete the expired ones). They are kept in
+# the 'sessions' cache (see CACHES), which with several processes must
+# be shared. Django's engines can be chosen with RANGO_SESSION_ENGINE,
+# e.g. 'django.contrib.sessions.backends.db'.
+SESSION_ENGINE = os.environ.get('RANGO_SESSION_ENGINE', 'rango.sessions')
+SESSION_CACHE_ALIAS = 'sessions'
 
 # Login URL to redirect to if user tries to access a login-restricted
 # page and is not logged in
 LOGIN_URL = 'rango:login'
 
 
+# Password hashing
+# https://docs.djangoproject.com/en/2.2/topics/auth/passwords/
+# New passwords are hashed with Argon2 when argon2-cffi is installed, and
+# with PBKDF2 otherwise. The other hashers are kept so existing hashes
+# still verify; they are replaced the next time their user logs in.
+
+PASSWORD_HASHERS = [
+    'rango.hashers.TunedArgon2PasswordHasher',
+    'rango.hashers.TunedPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+if importlib.util.find_spec('argon2') is None:
+    PASSWORD_HASHERS.remove('rango.hashers.TunedArgon2PasswordHasher')
+
+# Hashing costs below Django's defaults (Argon2 time cost 2, PBKDF2
+# 150000 iterations), so a login costs about half and two thirds as much
+# CPU. The trade-off: an attacker holding a leaked hash can also try
+# passwords that much faster. Raise them again if logins are not a
+# bottleneck; existing hashes follow on their users' next login.
+RANGO_ARGON2_TIME_COST = 1
+RANGO_ARGON2_MEMORY_COST = 512
+RANGO_ARGON2_PARALLELISM = 2
+RANGO_PBKDF2_ITERATIONS = 100000
+
+# Passwords are checked on a pool of RANGO_PASSWORD_WORKERS threads (0
+# checks them in the request's thread)
+AUTHENTICATION_BACKENDS = ['rango.auth.PooledModelBackend']
+RANGO_PASSWORD_WORKERS = 4
+
+# Login attempts allowed per client IP and per username: (attempts,
+# seconds). Attempts beyond these are refused before the password is
+# hashed.
+RANGO_LOGIN_RATE_LIMITS = {
+    'ip': (30, 5 * 60),
+    'username': (10, 5 * 60),
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -127,7 +274,121 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [STATIC_DIR, ]
+# Where collectstatic gathers the files in production. Outside of DEBUG
+# their names carry a hash of their content, and text files get gzip (and
+# brotli) compressed copies, so they can be cached forever.
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+if not DEBUG:
+    STATICFILES_STORAGE = \
+        'rango.assets.CompressedManifestStaticFilesStorage'
+
+# Serve the static files and uploads from Django, with cache headers,
+# when there is no front proxy (or CDN) to do it
+RANGO_SERVE_ASSETS = False
 
 # Uploaded media files
 MEDIA_ROOT = MEDIA_DIR
 MEDIA_URL = '/media/'
+
+# Number of background threads resizing uploaded profile pictures (0 to
+# resize them during the request instead)
+RANGO_IMAGE_WORKERS = 2
+
+# Caching
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# The local-memory cache is per-process; point this at memcached or
+# redis when running several processes so invalidations are shared.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'rango',
+    },
+    # Sessions have a cache of their own, sized for them, so that pages
+    # and fragments filling the default cache don't evict (and so log
+    # out) anyone. Size it for the number of sessions open at once.
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'rango-sessions',
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get(
+            'RANGO_SESSION_CACHE_SIZE', 100000))},
+    },
+}
+
+# Cache alias used by Rango and how long (in seconds) the rendered
+# category sidebar is kept before it is rebuilt anyway
+RANGO_CACHE_ALIAS = 'default'
+RANGO_CATEGORY_LIST_TIMEOUT = 60 * 60
+# How long (in seconds) pages cached for anonymous users are kept
+RANGO_PAGE_CACHE_TIMEOUT = 60 * 60
+
+# Categories are looked up by slug in a per-process LRU of
+# RANGO_CATEGORY_LOOKUP_SIZE entries, kept for RANGO_CATEGORY_LOOKUP_TIMEOUT
+# seconds (RANGO_CATEGORY_LOOKUP_MISS_TIMEOUT for unknown slugs), shared
+# through the cache as well when RANGO_CATEGORY_LOOKUP_SHARED is set
+RANGO_CATEGORY_LOOKUP_SIZE = 1000
+RANGO_CATEGORY_LOOKUP_TIMEOUT = 60
+RANGO_CATEGORY_LOOKUP_MISS_TIMEOUT = 10
+RANGO_CATEGORY_LOOKUP_SHARED = False
+
+# Number of entries kept in the index view's top categories and top
+# pages leaderboards
+RANGO_LEADERBOARD_SIZE = 5
+
+# Page and category counters are buffered in memory and flushed in
+# batches: every RANGO_COUNTER_FLUSH_INTERVAL seconds (0 disables the
+# background flush), or once RANGO_COUNTER_MAX_PENDING rows are pending
+RANGO_COUNTER_FLUSH_INTERVAL = 5
+RANGO_COUNTER_MAX_PENDING = 1000
+
+# Number of pages listed per page of a category
+RANGO_CATEGORY_PAGE_SIZE = 20
+
+# Search index: 'fts5' (an SQLite full-text table), 'memory' (a
+# per-process index) or 'auto' to use FTS5 when it is available, and how
+# strongly an object's views boost its text relevance
+RANGO_SEARCH_BACKEND = 'auto'
+RANGO_SEARCH_VIEWS_WEIGHT = 0.1
+
+# Seconds before the check_links command checks a page's URL again
+RANGO_LINK_CHECK_INTERVAL = 7 * 24 * 60 * 60
+
+# Trending scores: seconds for a view (or like) to count half as much,
+# and how many views a like is worth
+RANGO_TRENDING_HALF_LIFE = 24 * 60 * 60
+RANGO_TRENDING_LIKE_WEIGHT = 10
+# Seconds an event is left in the log before it is rolled up, so that
+# events from transactions still open when a later one was logged (and
+# rolled up) aren't skipped. Longer than any transaction logging events.
+RANGO_TRENDING_ROLLUP_DELAY = 60
+
+# Admin change lists: tables bigger than this many rows get an estimated
+# count (and filtered lists stop counting there), at most this many
+# search results are listed, and bulk actions update rows in batches
+RANGO_ADMIN_COUNT_LIMIT = 10000
+RANGO_ADMIN_SEARCH_LIMIT = 1000
+RANGO_ADMIN_BATCH_SIZE = 1000
+
+# Default and maximum number of results per page of the JSON API
+RANGO_API_PAGE_SIZE = 50
+RANGO_API_MAX_PAGE_SIZE = 500
+
+# Maximum number of SQL queries each view may run for a returning
+# visitor once the caches are warm (queries filling the caches don't
+# count). Going over is logged as a warning, or raises an error with
+# RANGO_QUERY_BUDGET_ERRORS (turned on by the query budget tests).
+RANGO_QUERY_BUDGET_ERRORS = False
+RANGO_QUERY_BUDGETS = {
+    'rango:index': 2,
+    'rango:about': 2,
+    'rango:show_category': 2,
+    'rango:export_category': 2,
+    'rango:search': 4,
+    'rango:goto': 1,
+    'rango:api_categories': 1,
+    'rango:api_category': 1,
+    'rango:api_category_pages': 2,
+    'rango:api_top': 1,
+    'rango:api_trending': 1,
+    'rango:api_search': 3,
+}
@@ -14,13 +14,27 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
-from rango import views
+from rango import assets, views
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('rango/', include('rango.urls')),
     path('admin/', admin.site.urls),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+if settings.RANGO_SERVE_ASSETS:
+    # No front proxy: serve the collected static files and the uploads
+    # ourselves, with cache headers (see rango.assets)
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % settings.STATIC_URL.lstrip('/'),
+                assets.serve),
+        re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'),
+                assets.serve, {'document_root': settings.MEDIA_ROOT,
+                               'immutable': assets.is_media_immutable}),
+    ]
+else:
+    urlpatterns += static(settings.MEDIA_URL,
+                          document_root=settings.MEDIA_ROOT)